@@ -5,10 +5,12 @@ from tkinter import ttk
 from ttkthemes import ThemedTk
 import os
 import configparser
+import threading
 
 from front.config import ENABLE_FULLSCREEN, DEFAULT_THEME, APPLE_COLORS, ENABLE_ANIMATIONS
 from backend.ModelManager import ModelManager
 from backend.HistoryManager import HistoryManager
+from backend.ImagePreprocessing import select_backend
 from front.model_selection_ui import ModelSelectionUI
 from front.tabs_ui import TabsUI
 from front.apple_styles import AppleStyleManager
@@ -47,6 +49,9 @@ class AppUI:
         self.model_manager = ModelManager()
         self.history_manager = HistoryManager()
         
+        # Pick the fastest preprocessing backend (benchmarks once per machine)
+        threading.Thread(target=select_backend, daemon=True).start()
+        
         # Create main container with padding
         self.main_container = ttk.Frame(self.root, style="AppleMain.TFrame")
         self.main_container.pack(fill='both', expand=True, padx=20, pady=20)
@@ -151,6 +156,7 @@ class AppUI:
     def _on_closing(self):
         """Handle window closing"""
         self._save_window_state()
+        self.model_manager.close()
         self.root.destroy()
     
     def show_notification(self, message, notification_type="info", duration=700):
@@ -0,0 +1,312 @@
+# backend/CompositeModels.py
+
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from .ImagePreprocessing import get_transform
+from .InferenceService import get_service
+
+# Registry 'composite' kinds
+COMPOSITE_CASCADE = 'cascade'
+COMPOSITE_ENSEMBLE = 'ensemble'
+
+# Which cascade stage decided an image
+STAGE_SCREENER = 'screener'
+STAGE_EXPERT = 'expert'
+
+DEFAULT_CASCADE_THRESHOLD = 0.9
+
+# How an ensemble combines its members' softmax outputs
+ENSEMBLE_AVERAGE = 'average'
+ENSEMBLE_VOTE = 'vote'
+ENSEMBLE_METHODS = (ENSEMBLE_AVERAGE, ENSEMBLE_VOTE)
+
+
+def _acquire_all(manager, names):
+    """Lease every named model's session, or none if one fails to load"""
+    sessions = []
+    try:
+        for name in names:
+            sessions.append(manager.acquire_model(name))
+    except Exception:
+        for name in names[:len(sessions)]:
+            manager.release_model(name)
+        raise
+    return sessions
+
+
+def _release_all(manager, names):
+    for name in names:
+        manager.release_model(name)
+
+
+class CascadeModel:
+    """
+    Stand-in for an InferenceSession that pairs two registered models: a
+    fast screener runs on every image and a heavier expert only where the
+    screener's top probability is below `threshold`.
+
+    It carries the same cached hooks as a loaded session, so get_transform,
+    get_service and evaluate_model work on it unchanged. Member sessions
+    are leased from the ModelManager for each request rather than held,
+    so they stay under its loaded-model budget between requests.
+    """
+
+    def __init__(self, manager, name, screener, expert, threshold=DEFAULT_CASCADE_THRESHOLD):
+        self.manager = manager
+        self.name = name
+        self.screener = screener
+        self.expert = expert
+        self.threshold = float(threshold)
+        self._model_path = name
+        self._service = CascadeService(self)
+
+    @property
+    def _preprocess_transform(self):
+        # Both members share one spec (checked by ModelManager.create_cascade)
+        return get_transform(self.manager.load_model(self.screener))
+
+    def sessions(self):
+        """Return the (screener, expert) sessions, loading them if needed."""
+        return self.manager.load_model(self.screener), self.manager.load_model(self.expert)
+
+    def acquire(self):
+        """Lease the (screener, expert) sessions; pair with release()."""
+        return tuple(_acquire_all(self.manager, [self.screener, self.expert]))
+
+    def release(self):
+        _release_all(self.manager, [self.screener, self.expert])
+
+    def resident_members(self):
+        """Members load() keeps loaded: both."""
+        return [self.screener, self.expert]
+
+    def load(self):
+        """Make sure both members can be loaded."""
+        self.sessions()
+
+
+class CascadeService:
+    """
+    Submit/predict interface of a CascadeModel, chained on the members'
+    InferenceServices. The returned future's `stages` attribute lists,
+    per image, STAGE_SCREENER or STAGE_EXPERT; `stats` counts images and
+    escalations over the service's lifetime.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.stats = {'images': 0, 'escalated': 0}
+
+    def submit(self, tensor):
+        """Queue a (n, ...) input; returns a Future of (n, num_classes)."""
+        result = Future()
+        result.set_running_or_notify_cancel()
+        try:
+            screener, expert = self.model.acquire()
+        except Exception as e:
+            result.set_exception(e)
+            return result
+        result.add_done_callback(lambda _: self.model.release())
+
+        def finish(probs, escalate):
+            self.stats['images'] += len(probs)
+            self.stats['escalated'] += int(escalate.sum())
+            result.stages = [STAGE_EXPERT if e else STAGE_SCREENER for e in escalate]
+            result.set_result(probs)
+
+        def on_screened(future):
+            try:
+                probs = np.array(future.result())  # Copy; expert rows are written in
+            except Exception as e:
+                result.set_exception(e)
+                return
+            escalate = probs.max(axis=1) < self.model.threshold
+            if not escalate.any():
+                finish(probs, escalate)
+                return
+
+            def on_expert(expert_future):
+                try:
+                    probs[escalate] = expert_future.result()
+                except Exception as e:
+                    result.set_exception(e)
+                    return
+                finish(probs, escalate)
+
+            hard = np.ascontiguousarray(tensor[escalate])
+            get_service(expert).submit(hard).add_done_callback(on_expert)
+
+        get_service(screener).submit(tensor).add_done_callback(on_screened)
+        return result
+
+    def predict(self, tensor, timeout=None):
+        """Submit and wait for the result."""
+        return self.submit(tensor).result(timeout)
+
+    def stop(self):
+        """Nothing to release; member services belong to their sessions."""
+
+
+def combine_outputs(outputs, method=ENSEMBLE_AVERAGE):
+    """
+    Combine a list of (n, num_classes) member probabilities.
+
+    'average' returns their mean. 'vote' returns each class's share of the
+    members' top-1 votes, with ties going to the higher mean probability;
+    rows still sum to 1.
+    """
+    mean = np.mean(outputs, axis=0)
+    if method == ENSEMBLE_AVERAGE:
+        return mean
+    if method != ENSEMBLE_VOTE:
+        raise ValueError(f"Unknown ensemble method: {method}")
+    votes = np.zeros_like(mean)
+    rows = np.arange(len(mean))
+    for probs in outputs:
+        votes[rows, np.argmax(probs, axis=1)] += 1
+    # A vote outweighs any mean difference (< 1), so this only breaks ties
+    return (votes + mean) / (len(outputs) + 1)
+
+
+class EnsembleModel:
+    """
+    Stand-in for an InferenceSession that runs one preprocessed tensor
+    through several registered models and combines their outputs with
+    combine_outputs().
+
+    When all members fit in the ModelManager's loaded-model budget they run
+    concurrently on their own InferenceServices (ONNX Runtime releases the
+    GIL). Otherwise they are loaded and run one after another, so the
+    ensemble never holds more sessions than the budget allows.
+    """
+
+    def __init__(self, manager, name, members, method=ENSEMBLE_AVERAGE):
+        self.manager = manager
+        self.name = name
+        self.members = list(members)
+        self.method = method
+        self._model_path = name
+        self._service = EnsembleService(self)
+
+    @property
+    def concurrent(self):
+        """True when every member can stay loaded at once."""
+        return self.manager.fits_in_budget(self.members)
+
+    @property
+    def _preprocess_transform(self):
+        # All members share one spec (checked by ModelManager.create_ensemble)
+        return get_transform(self.manager.load_model(self.members[0]))
+
+    def sessions(self):
+        """Return all member sessions, loading them if needed."""
+        return [self.manager.load_model(member) for member in self.members]
+
+    def acquire(self):
+        """Lease all member sessions; pair with release()."""
+        return _acquire_all(self.manager, self.members)
+
+    def release(self):
+        _release_all(self.manager, self.members)
+
+    def resident_members(self):
+        """Members load() keeps loaded: all if they fit together, else the first."""
+        return list(self.members) if self.concurrent else self.members[:1]
+
+    def load(self):
+        """Load the members that fit in memory together."""
+        for member in self.resident_members():
+            self.manager.load_model(member)
+
+
+class EnsembleService:
+    """
+    Submit/predict interface of an EnsembleModel. The returned future's
+    `member_outputs` attribute holds each member's probabilities, in
+    member order.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.stats = {'images': 0}
+        self._reverse = False  # Sequential mode alternates member order
+
+    def submit(self, tensor):
+        """Queue a (n, ...) input; returns a Future of (n, num_classes)."""
+        result = Future()
+        result.set_running_or_notify_cancel()
+        if self.model.concurrent:
+            self._submit_concurrent(tensor, result)
+        else:
+            threading.Thread(target=self._run_sequential, args=(tensor, result),
+                             daemon=True).start()
+        return result
+
+    def predict(self, tensor, timeout=None):
+        """Submit and wait for the result."""
+        return self.submit(tensor).result(timeout)
+
+    def stop(self):
+        """Nothing to release; member services belong to their sessions."""
+
+    def _finish(self, result, outputs):
+        try:
+            probs = combine_outputs(outputs, self.model.method)
+        except Exception as e:
+            result.set_exception(e)
+            return
+        self.stats['images'] += len(probs)
+        result.member_outputs = outputs
+        result.set_result(probs)
+
+    def _submit_concurrent(self, tensor, result):
+        try:
+            sessions = self.model.acquire()
+        except Exception as e:
+            result.set_exception(e)
+            return
+        result.add_done_callback(lambda _: self.model.release())
+
+        outputs = [None] * len(sessions)
+        pending = [len(sessions)]
+        lock = threading.Lock()
+
+        def on_member(index, future):
+            try:
+                outputs[index] = future.result()
+            except Exception as e:
+                with lock:
+                    if not result.done():
+                        result.set_exception(e)
+                return
+            with lock:
+                pending[0] -= 1
+                if pending[0] or result.done():
+                    return
+            self._finish(result, outputs)
+
+        for index, session in enumerate(sessions):
+            get_service(session).submit(tensor).add_done_callback(
+                lambda f, i=index: on_member(i, f))
+
+    def _run_sequential(self, tensor, result):
+        # Start with the members the previous call left loaded, so only
+        # the others have to be reloaded under the budget
+        order = list(range(len(self.model.members)))
+        if self._reverse:
+            order.reverse()
+        self._reverse = not self._reverse
+
+        manager = self.model.manager
+        outputs = [None] * len(order)
+        try:
+            for index in order:
+                with manager.lease_model(self.model.members[index]) as session:
+                    outputs[index] = get_service(session).predict(tensor)
+        except Exception as e:
+            result.set_exception(e)
+            return
+        self._finish(result, outputs)
@@ -24,8 +24,11 @@ class ConfusionMatrixManager:
                 writer = csv.writer(f)
                 writer.writerow(['PNGName', 'Timestamp', 'Metrics', 'Model', 'Path', 'Dataset'])
 
-    def save_confusion_matrix(self, cm, class_names, model_name, dataset_path):
-        """Save confusion matrix image and record metadata in CSV."""
+    def save_confusion_matrix(self, cm, class_names, model_name, dataset_path, escalated=None):
+        """
+        Save confusion matrix image and record metadata in CSV.
+        `escalated` is a cascade's fraction of images sent to its expert.
+        """
         metrics = compute_metrics(cm)
         metrics_text = (
             f"Accuracy:{metrics['accuracy']:.4f}\n"
@@ -33,6 +36,8 @@ class ConfusionMatrixManager:
             f"Recall:{metrics['recall']:.4f}\n"
             f"F1:{metrics['f1']:.4f}"
         )
+        if escalated is not None:
+            metrics_text += f"\nEscalated:{escalated:.4f}"
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         png_name = f'confusion_{timestamp.replace(":", "-").replace(" ", "_")}.png'
         img_path = os.path.join(self.IMAGES_DIR, png_name)
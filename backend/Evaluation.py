@@ -2,14 +2,17 @@
 
 import os
 import queue
+from collections import deque
 import threading
 import warnings
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Tuple
 
 import numpy as np
 
-from .ImagePreprocessing import preprocess_image
-from .Inference import predict_image
+from .CompositeModels import STAGE_EXPERT
+from .ImagePreprocessing import get_transform
+from .InferenceService import get_service
+from .PreprocessPool import PreprocessPool, default_workers
 
 # Special token to signal the end of loading images
 STOP_TOKEN = object()
@@ -62,53 +65,162 @@ def display_evaluation_results(results: Tuple[np.ndarray, Dict[str, float]]) ->
         lines.append(" ".join(str(x) for x in row))
     return "\n".join(lines)
 
-def evaluate_model(session,
-                   dataset_path: str,
-                   class_names: List[str],
-                   queue_size: int = 4) -> Tuple[np.ndarray, Dict[str, float]]:
+def list_dataset(dataset_path: str,
+                 class_names: List[str],
+                 max_per_class: int = None) -> List[Tuple[int, str]]:
     """
-    Evaluate model on images under dataset_path/class_name folders.
-    Returns (confusion_matrix, metrics_dict).
+    Return (class_index, path) for every image under dataset_path/class_name,
+    or for the first max_per_class (sorted by name) of each class.
+    Missing class folders are skipped with a warning.
     """
     valid_exts = ('.jpg', '.jpeg', '.png')
-    num_classes = len(class_names)
+    files = []
+    for idx, cls in enumerate(class_names):
+        folder = os.path.join(dataset_path, cls)
+        if not os.path.isdir(folder):
+            warnings.warn(f"Missing folder: {folder}")
+            continue
+        names = [f for f in os.listdir(folder) if f.lower().endswith(valid_exts)]
+        if max_per_class is not None:
+            names = sorted(names)[:max_per_class]
+        files.extend((idx, os.path.join(folder, fname)) for fname in names)
+    return files
 
+def _thread_inputs(transform, files, queue_size, timings):
+    """
+    Yield (true_idx, tensor) from a single loader thread; tensor is None
+    when preprocessing failed.
+    """
     img_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    # Ring of reusable input buffers: up to queue_size slots can sit in the
+    # queue, one is being consumed and one is being filled, so a slot is
+    # never overwritten while still in use.
+    ring = transform.allocate(queue_size + 2)
 
     def loader():
-        for idx, cls in enumerate(class_names):
-            folder = os.path.join(dataset_path, cls)
-            if not os.path.isdir(folder):
-                warnings.warn(f"Missing folder: {folder}")
-                continue
-            for fname in os.listdir(folder):
-                if not fname.lower().endswith(valid_exts):
-                    continue
-                path = os.path.join(folder, fname)
-                try:
-                    tensor = preprocess_image(path)
-                    img_queue.put((idx, tensor))
-                except Exception as e:
-                    warnings.warn(f"[Skip] {path}: {e}")
+        slot = 0
+        for idx, path in files:
+            try:
+                tensor = transform([path], out=ring[slot:slot + 1], timings=timings)
+                slot = (slot + 1) % len(ring)
+                img_queue.put((idx, tensor))
+            except Exception as e:
+                warnings.warn(f"[Skip] {path}: {e}")
+                img_queue.put((idx, None))
         img_queue.put(STOP_TOKEN)
 
     threading.Thread(target=loader, daemon=True).start()
 
-    y_true, y_pred = [], []
-
     while True:
         item = img_queue.get()
         if item is STOP_TOKEN:
             break
-        true_idx, tensor = item
+        yield item
+
+def _pool_inputs(transform, files, workers, timings):
+    """
+    Yield (true_idx, tensor) from a PreprocessPool of worker processes;
+    tensor is a view into shared memory, valid until the next item.
+    """
+    with PreprocessPool(transform.spec, transform.backend(), workers) as pool:
+        for idx, path, tensor, error, records in pool.imap(files):
+            if timings is not None:
+                timings.extend(records)
+            if error is not None:
+                warnings.warn(f"[Skip] {path}: {error}")
+            yield idx, tensor
+
+def evaluate_model(session,
+                   dataset_path: str,
+                   class_names: List[str],
+                   queue_size: int = 4,
+                   timings: List[dict] = None,
+                   workers: int = None,
+                   batch_size: int = 8,
+                   max_per_class: int = None,
+                   progress: Callable[[int, int], None] = None,
+                   service=None) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Evaluate model on images under dataset_path/class_name folders.
+
+    Images are preprocessed by `workers` processes writing into a shared
+    memory ring (default: one per core but one); workers=0 uses a single
+    loader thread instead. Inference runs `batch_size` images per call
+    (chunked automatically for fixed-batch models). If `timings` is a
+    list, per-image decode records are appended to it. max_per_class
+    limits a quick evaluation to a fixed sample of each class.
+    `progress(done, total)` is called after each batch. `service` runs the
+    batches (default: the session's InferenceService); one with a
+    `concurrency` attribute, such as a ReplicaPool, gets that many batches
+    in flight at once.
+    Returns (confusion_matrix, metrics_dict); for a cascade the metrics
+    also hold 'escalated', the fraction of images the expert decided.
+    """
+    num_classes = len(class_names)
+    files = list_dataset(dataset_path, class_names, max_per_class)
+    total = len(files)
+    transform = get_transform(session)
+    service = service or get_service(session)
+    in_flight = getattr(service, 'concurrency', 1)
+
+    if workers is None:
+        workers = default_workers()
+    if workers > 0 and total > 1:
+        inputs = _pool_inputs(transform, files, workers, timings)
+    else:
+        inputs = _thread_inputs(transform, files, queue_size, timings)
+
+    y_true, y_pred = [], []
+    # Tensors are gathered into batch buffers so inference runs batch_size
+    # images per session.run instead of one; the model's InferenceService
+    # may coalesce them further with concurrent requests. One buffer more
+    # than the batches in flight lets the next batch fill meanwhile.
+    buffers = [transform.allocate(batch_size) for _ in range(in_flight + 1)]
+    batch = buffers[0]
+    labels = []
+    pending = deque()  # (future, labels) in submission order
+    submitted = 0
+    escalated = None  # Counted only when the model reports cascade stages
+
+    def collect():
+        nonlocal escalated
+        future, batch_labels = pending.popleft()
         try:
-            probs = predict_image(session, tensor)
-            pred_idx = int(np.argmax(probs))
+            probs = future.result()
+            preds = [int(p) for p in np.argmax(probs, axis=1)]
+            stages = getattr(future, 'stages', None)
+            if stages is not None:
+                escalated = (escalated or 0) + stages.count(STAGE_EXPERT)
         except Exception:
-            pred_idx = 0
-        y_true.append(true_idx)
-        y_pred.append(pred_idx)
+            preds = [0] * len(batch_labels)
+        y_true.extend(batch_labels)
+        y_pred.extend(preds)
+
+    def flush(done):
+        nonlocal batch, submitted
+        if labels:
+            if len(pending) >= in_flight:
+                collect()  # Frees the oldest buffer
+            pending.append((service.submit(batch[:len(labels)]), list(labels)))
+            labels.clear()
+            submitted += 1
+            batch = buffers[submitted % len(buffers)]
+        if progress is not None:
+            progress(done, total)
+
+    done = 0
+    for done, (true_idx, tensor) in enumerate(inputs, 1):
+        if tensor is not None:
+            batch[len(labels)] = tensor[0]
+            labels.append(true_idx)
+        if len(labels) == batch_size:
+            flush(done)
+    flush(done)
+    while pending:
+        collect()
 
     cm = compute_confusion_matrix(y_true, y_pred, num_classes)
     metrics = compute_metrics(cm)
+    if escalated is not None and y_true:
+        metrics['escalated'] = escalated / len(y_true)
     return cm, metrics
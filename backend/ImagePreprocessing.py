@@ -1,47 +1,866 @@
 # backend/ImagePreprocessing.py
 
-import cv2
-import numpy as np
+import json
 import os
+import platform
+import tempfile
+import threading
+import time
+import warnings
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2
+except ImportError:  # PIL backend still works without OpenCV
+    cv2 = None
+
+from .Inference import get_input_channels, is_raw_input
+from .ModelOptimization import (META_CHANNEL_ORDER, META_INPUT_SIZE, META_MEAN,
+                                META_STAGES, META_STD, META_WINDOW_CENTER,
+                                META_WINDOW_WIDTH, parse_float_list)
+
+VALID_EXTS = {".jpg", ".jpeg", ".png"}
+INPUT_SIZE = (256, 256)  # Default (width, height) fed to the model
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+# Single-channel models: average of the ImageNet statistics
+GRAYSCALE_MEAN = (0.449,)
+GRAYSCALE_STD = (0.226,)
+
+# Persisted backend choice, one entry per machine
+BACKEND_CHOICE_FILE = os.path.join("models", "preprocess_backend.json")
+# Max abs difference (normalized units) a backend may show against the reference
+EQUIVALENCE_ATOL = 1e-4
+
+# libpng's RGB -> gray weights (0.299, 0.587 in 1/32768, truncated) that
+# OpenCV requests when reading a color PNG as grayscale
+_PNG_GRAY_WEIGHTS = np.array([9797, 19234, 3737], dtype=np.uint32)
+
+# Optional uint8 stages run on the resized image before normalization
+STAGE_CLAHE = 'clahe'
+STAGE_HISTOGRAM_MATCHING = 'histogram_matching'
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = 8
+
+
+def _build_normalization_lut(mean, std):
+    """
+    Build a (C, 256) float32 table mapping every uint8 value to its
+    normalized value per channel, i.e. (v / 255 - mean[c]) / std[c].
+    The arithmetic mirrors the original float32 pipeline so results are
+    bit-identical.
+    """
+    levels = np.arange(256, dtype=np.float32) / np.float32(255.0)
+    mean = np.asarray(mean, dtype=np.float32).reshape(-1, 1)
+    std = np.asarray(std, dtype=np.float32).reshape(-1, 1)
+    return np.ascontiguousarray((levels[None, :] - mean) / std)
+
+
+# How a model expects its input. size is (width, height); mean/std are in
+# the model's channel order; raw means uint8 NHWC with normalization
+# folded into the graph; stages is a tuple from parse_stages(); window is
+# the (center, width) applied to 16-bit sources, None for auto min..max.
+PreprocessSpec = namedtuple(
+    'PreprocessSpec',
+    ['size', 'channels', 'mean', 'std', 'channel_order', 'raw', 'stages', 'window'],
+    defaults=((), None)
+)
+
+
+def default_spec(channels=3, raw=False):
+    """Spec used when nothing else is known: 256x256 BGR, ImageNet statistics."""
+    if channels == 1:
+        return PreprocessSpec(INPUT_SIZE, 1, GRAYSCALE_MEAN, GRAYSCALE_STD, 'BGR', raw)
+    return PreprocessSpec(INPUT_SIZE, channels, IMAGENET_MEAN, IMAGENET_STD, 'BGR', raw)
+
+
+def _check_extension(file_path):
+    _, ext = os.path.splitext(file_path)
+    ext = ext.lower()
+    if ext not in VALID_EXTS:
+        raise ValueError(f"Unsupported extension '{ext}'. Use JPG or PNG.")
+
+
+if cv2 is not None:
+    # libjpeg can decode directly at 1/2, 1/4 or 1/8 scale
+    _REDUCED_COLOR_FLAGS = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }
+    _REDUCED_GRAYSCALE_FLAGS = {
+        1: cv2.IMREAD_GRAYSCALE,
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    }
+
+
+def _probe_image(file_path):
+    """Read format, (width, height) and PIL mode from the file header only."""
+    try:
+        with Image.open(file_path) as img:
+            return img.format, img.size, img.mode
+    except Exception:
+        return None, None, None
+
+
+def _reduction_factor(image_format, source_size, target_size):
+    """
+    Largest JPEG decode scale that still yields at least target_size.
+    Other formats (PNG has no scaled decode) always decode at full size.
+    """
+    if image_format != 'JPEG' or source_size is None:
+        return 1
+    width, height = source_size
+    for factor in (8, 4, 2):
+        if width // factor >= target_size[0] and height // factor >= target_size[1]:
+            return factor
+    return 1
+
+
+def parse_stages(stages):
+    """
+    Normalize a stage list (JSON string or list of dicts) into a hashable
+    tuple. Supported entries:
+      {"name": "clahe", "clip_limit": 2.0, "tile_grid": 8}
+      {"name": "histogram_matching", "reference": "path/to/reference.png"}
+    Raises ValueError on unknown stages or a missing reference image.
+    """
+    if not stages:
+        return ()
+    if isinstance(stages, str):
+        try:
+            stages = json.loads(stages)
+        except ValueError:
+            raise ValueError(f"Invalid preprocessing stages: {stages!r}")
+
+    parsed = []
+    for stage in stages:
+        name = stage.get('name')
+        if name == STAGE_CLAHE:
+            parsed.append((STAGE_CLAHE,
+                           float(stage.get('clip_limit', CLAHE_CLIP_LIMIT)),
+                           int(stage.get('tile_grid', CLAHE_TILE_GRID))))
+        elif name == STAGE_HISTOGRAM_MATCHING:
+            reference = stage.get('reference')
+            if not reference or not os.path.isfile(reference):
+                raise ValueError(f"Histogram matching reference not found: {reference}")
+            parsed.append((STAGE_HISTOGRAM_MATCHING, os.path.abspath(reference)))
+        else:
+            raise ValueError(f"Unknown preprocessing stage '{name}'.")
+    return tuple(parsed)
+
+
+_clahe_local = threading.local()
+
+
+def _get_clahe(clip_limit, tile_grid):
+    """
+    Cached cv2.CLAHE per configuration. CLAHE objects keep internal
+    buffers, so each thread gets its own cache.
+    """
+    cache = getattr(_clahe_local, 'cache', None)
+    if cache is None:
+        cache = _clahe_local.cache = {}
+    key = (clip_limit, tile_grid)
+    clahe = cache.get(key)
+    if clahe is None:
+        clahe = cache[key] = cv2.createCLAHE(clipLimit=clip_limit,
+                                              tileGridSize=(tile_grid, tile_grid))
+    return clahe
+
+
+@lru_cache(maxsize=16)
+def _reference_cdf(reference_path, size):
+    """
+    Normalized 256-entry CDF of a reference image, computed once at the
+    model input size and reused for every matched image.
+    """
+    with Image.open(reference_path) as img:
+        reference = np.asarray(img.convert('L').resize(size, Image.Resampling.BILINEAR))
+    hist = np.bincount(reference.ravel(), minlength=256).astype(np.float64)
+    cdf = np.cumsum(hist)
+    return cdf / cdf[-1]
+
+
+def _match_histogram(image, reference_cdf):
+    """Map image through a 256-entry LUT so its CDF follows the reference."""
+    # Count every channel, as the reference histogram does
+    if cv2 is not None:
+        hist = cv2.calcHist([image.reshape(-1, 1)], [0], None, [256], [0, 256]).ravel()
+    else:
+        hist = np.bincount(image.ravel(), minlength=256)
+    cdf = np.cumsum(hist, dtype=np.float64)
+    cdf /= cdf[-1]
+    lut = np.searchsorted(reference_cdf, cdf).clip(0, 255).astype(np.uint8)
+    if cv2 is not None:
+        return cv2.LUT(image, lut)
+    return lut[image]
+
+
+def _is_16bit_mode(mode):
+    """PIL reports 16-bit grayscale PNGs as 'I;16*' (or 'I' in older versions)."""
+    return mode is not None and mode.startswith('I')
+
+
+@lru_cache(maxsize=8)
+def _window_lut(center, width):
+    """65536-entry uint16 -> uint8 table for a fixed window/level."""
+    low = center - width / 2.0
+    levels = (np.arange(65536, dtype=np.float32) - low) * (255.0 / width)
+    return np.clip(np.rint(levels), 0, 255).astype(np.uint8)
+
+
+def window_to_uint8(image, window=None):
+    """
+    Map 16-bit grayscale pixels into the 8-bit model range in one pass.
+    window is (center, width); None stretches the image's own min..max.
+    """
+    if window is not None:
+        return np.take(_window_lut(float(window[0]), float(window[1])), image)
+
+    if cv2 is not None:
+        low, high = cv2.minMaxLoc(image)[:2]
+    else:
+        low, high = float(image.min()), float(image.max())
+    if high <= low:
+        return np.zeros(image.shape, dtype=np.uint8)
+    alpha = 255.0 / (high - low)
+    if cv2 is not None:
+        # No pixel lies below the minimum, so the abs() is a no-op
+        return cv2.convertScaleAbs(image, alpha=alpha, beta=-low * alpha)
+    return np.rint((image - low) * alpha).astype(np.uint8)
+
+
+def _parse_size(value):
+    sizes = parse_float_list(value)
+    if not sizes or len(sizes) > 2:
+        return None
+    width = int(sizes[0])
+    height = int(sizes[-1])
+    return (width, height) if width > 0 and height > 0 else None
+
+
+def spec_from_session(session, stages=None):
+    """
+    Build the PreprocessSpec of a loaded model from its input shape and the
+    optional mean/std/channel_order/input_size/preprocess_stages entries of
+    its ONNX metadata_props. Missing entries fall back to default_spec().
+    A non-None `stages` (e.g. from the model registry) overrides the
+    metadata stages.
+    """
+    meta = session.get_modelmeta().custom_metadata_map
+    channels = get_input_channels(session)
+    raw = is_raw_input(session)
+    spec = default_spec(channels, raw)
+
+    shape = session.get_inputs()[0].shape
+    hw = shape[1:3] if raw else shape[2:4]
+    if len(shape) == 4 and all(isinstance(d, int) and d > 0 for d in hw):
+        size = (hw[1], hw[0])
+    else:
+        size = _parse_size(meta.get(META_INPUT_SIZE)) or spec.size
+
+    mean = parse_float_list(meta.get(META_MEAN))
+    std = parse_float_list(meta.get(META_STD))
+    if not mean or len(mean) != channels:
+        mean = spec.mean
+    if not std or len(std) != channels:
+        std = spec.std
+
+    order = meta.get(META_CHANNEL_ORDER, spec.channel_order).upper()
+    if order not in ('BGR', 'RGB'):
+        order = spec.channel_order
+
+    if stages is None:
+        stages = meta.get(META_STAGES)
+
+    window = None
+    center = parse_float_list(meta.get(META_WINDOW_CENTER))
+    width = parse_float_list(meta.get(META_WINDOW_WIDTH))
+    if center and width and width[0] > 0:
+        window = (center[0], width[0])
+
+    return PreprocessSpec(size, channels, tuple(mean), tuple(std), order, raw,
+                          parse_stages(stages), window)
+
+
+def _record_decode(timings, file_path, source_size, image, factor, grayscale, decode_ms):
+    if timings is not None:
+        timings.append({
+            'path': file_path,
+            'source_size': source_size,
+            'decoded_size': (image.shape[1], image.shape[0]),
+            'scale': factor,
+            'grayscale': grayscale,
+            'decode_ms': decode_ms,
+            # Fraction of source pixels never materialized by the decoder
+            'pixels_saved': 1.0 - 1.0 / (factor * factor),
+        })
+
+
+def _apply_lut(image, out, lut):
+    if image.ndim == 2:
+        # HW uint8 -> CHW float32 in one gather; each LUT row is one channel
+        np.take(lut, image, axis=1, out=out)
+    else:
+        # HWC uint8 -> CHW float32 via per-channel LUT, written in place
+        for c in range(image.shape[2]):
+            np.take(lut[c], image[:, :, c], out=out[c])
+
+
+class PreprocessBackend:
+    """
+    One way of turning an image file into a model input.
+    Every backend must produce the same tensors as the 'numpy' reference
+    (within EQUIVALENCE_ATOL); they only differ in speed.
+    """
+    name = None
+
+    def is_available(self):
+        return cv2 is not None
+
+    def decode(self, file_path, channels, size, timings=None):
+        """
+        Decode at the smallest scale still covering size, as uint8: HW for
+        single-channel sources (or channels == 1), BGR HWC otherwise.
+        16-bit grayscale sources are returned as uint16 HW.
+        """
+        image_format, source_size, mode = _probe_image(file_path)
+        factor = _reduction_factor(image_format, source_size, size)
+        grayscale = mode == 'L' or channels == 1
+        flags = _REDUCED_GRAYSCALE_FLAGS if grayscale else _REDUCED_COLOR_FLAGS
+        flag = flags[factor]
+        if _is_16bit_mode(mode):
+            # Keep all 16 bits; windowed to uint8 after the resize
+            grayscale = True
+            flag = cv2.IMREAD_UNCHANGED
+
+        start = time.perf_counter()
+        image = cv2.imread(file_path, flag)
+        decode_ms = (time.perf_counter() - start) * 1000.0
+        if image is None:
+            raise ValueError(f"Cannot load image at '{file_path}'.")
+        _record_decode(timings, file_path, source_size, image, factor, grayscale, decode_ms)
+        return image
+
+    def resize(self, image, size):
+        try:
+            return cv2.resize(image, size)
+        except Exception as e:
+            raise ValueError(f"Resize failed: {e}")
+
+    def load(self, file_path, transform, timings=None):
+        """
+        Decode and resize to the transform's size as uint8: HW for
+        grayscale, HWC in the model's channel order otherwise.
+        """
+        image = self.decode(file_path, transform.channels, transform.size, timings)
+        image = transform.prepare(self.resize(image, transform.size))
+        if transform.rgb and image.ndim == 3:
+            image = image[:, :, ::-1]
+        return image
+
+    def normalize_into(self, file_path, out, transform, timings=None):
+        """Write the normalized (C,H,W) float32 tensor for file_path into out."""
+        _apply_lut(self.load(file_path, transform, timings), out, transform.lut)
+
+
+class NumpyBackend(PreprocessBackend):
+    """OpenCV decode and resize, NumPy LUT normalization (reference)."""
+    name = 'numpy'
+
 
-def preprocess_image(file_path):
+class OpenCVDnnBackend(PreprocessBackend):
+    """OpenCV decode, then cv2.dnn blob: resize, scale, mean and layout in C."""
+    name = 'opencv_dnn'
+
+    def is_available(self):
+        return cv2 is not None and hasattr(cv2, 'dnn')
+
+    def normalize_into(self, file_path, out, transform, timings=None):
+        image = self.decode(file_path, transform.channels, transform.size, timings)
+        if transform.stages or image.dtype != np.uint8:
+            # Windowing and stages need the downscaled image; the blob
+            # resize is then a no-op
+            image = transform.prepare(self.resize(image, transform.size))
+        if image.ndim == 2 and transform.channels == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if hasattr(cv2.dnn, 'blobFromImageWithParams'):
+            # OpenCV >= 4.8 supports a per-channel scale factor
+            params = cv2.dnn.Image2BlobParams(transform.blob_scale, transform.size,
+                                              transform.blob_mean, transform.rgb,
+                                              cv2.CV_32F)
+            blob = cv2.dnn.blobFromImageWithParams(image, params)
+        else:
+            blob = cv2.dnn.blobFromImage(image, 1.0, transform.size, transform.blob_mean,
+                                         transform.rgb, False, cv2.CV_32F)
+            blob *= np.asarray(transform.blob_scale, dtype=np.float32).reshape(1, -1, 1, 1)
+        np.copyto(out, blob[0])
+
+
+def _linear_taps(src, dst, clamp):
+    """
+    Source indices and weights of cv2.resize INTER_LINEAR along one axis,
+    computed in float32 like OpenCV. Columns (clamp=True) pin the weight
+    at the borders; rows only clamp the indices.
+    """
+    f = ((np.arange(dst) + 0.5) * (1.0 / (dst / src)) - 0.5).astype(np.float32)
+    s = np.floor(f).astype(np.int64)
+    f = (f - s).astype(np.float32)
+    if clamp:
+        f[s < 0] = 0
+        s[s < 0] = 0
+        f[s >= src - 1] = 0
+        s[s >= src - 1] = src - 1
+    return np.clip(s, 0, src - 1), np.clip(s + 1, 0, src - 1), np.float32(1) - f, f
+
+
+def _resize_linear(image, size):
+    """
+    NumPy port of cv2.resize(image, size) (bilinear, no antialiasing).
+    uint8 uses OpenCV's 11-bit fixed point and matches it bit for bit;
+    other dtypes use float32 weights and may differ by rounding.
+    """
+    width, height = size
+    x0, x1, ax0, ax1 = _linear_taps(image.shape[1], width, clamp=True)
+    y0, y1, by0, by1 = _linear_taps(image.shape[0], height, clamp=False)
+    col = (1, -1) + (1,) * (image.ndim - 2)
+    row = (-1, 1) + (1,) * (image.ndim - 2)
+    if image.dtype == np.uint8:
+        scale = np.float32(2048)  # INTER_RESIZE_COEF_SCALE
+        ax0, ax1, by0, by1 = (np.rint(w * scale).astype(np.int32) for w in (ax0, ax1, by0, by1))
+        src = image.astype(np.int32)
+        rows = src[:, x0] * ax0.reshape(col) + src[:, x1] * ax1.reshape(col)
+        out = (((by0.reshape(row) * (rows[y0] >> 4)) >> 16)
+               + ((by1.reshape(row) * (rows[y1] >> 4)) >> 16) + 2) >> 2
+    else:
+        src = image.astype(np.float32)
+        rows = src[:, x0] * ax0.reshape(col) + src[:, x1] * ax1.reshape(col)
+        out = np.rint(rows[y0] * by0.reshape(row) + rows[y1] * by1.reshape(row))
+    info = np.iinfo(image.dtype)
+    return np.clip(out, info.min, info.max).astype(image.dtype)
+
+
+class PILBackend(PreprocessBackend):
+    """
+    Pure PIL decode for machines without OpenCV, resized with a NumPy port
+    of OpenCV's bilinear resize. PIL's own resize antialiases when
+    downscaling and would feed the model different inputs.
+    """
+    name = 'pil'
+
+    def is_available(self):
+        return True
+
+    def decode(self, file_path, channels, size, timings=None):
+        start = time.perf_counter()
+        try:
+            img = Image.open(file_path)
+        except Exception:
+            raise ValueError(f"Cannot load image at '{file_path}'.")
+        source_size = img.size
+        grayscale = img.mode == 'L' or channels == 1
+        if _is_16bit_mode(img.mode):
+            grayscale = True
+            image = np.asarray(img).astype(np.uint16, copy=False)
+        else:
+            if img.format == 'JPEG':
+                img.draft('L' if grayscale else 'RGB', size)
+            if grayscale and img.mode != 'L' and img.format != 'JPEG':
+                # Color PNG read as gray: convert like libpng, not PIL
+                rgb = np.asarray(img.convert('RGB'), dtype=np.uint32)
+                image = ((rgb @ _PNG_GRAY_WEIGHTS) >> 15).astype(np.uint8)
+            else:
+                image = np.asarray(img.convert('L' if grayscale else 'RGB'))
+            if not grayscale:
+                image = image[:, :, ::-1]  # RGB -> BGR to match the OpenCV path
+        decode_ms = (time.perf_counter() - start) * 1000.0
+        factor = max(1, source_size[0] // image.shape[1])
+        _record_decode(timings, file_path, source_size, image, factor, grayscale, decode_ms)
+        return image
+
+    def resize(self, image, size):
+        try:
+            return _resize_linear(image, size)
+        except Exception as e:
+            raise ValueError(f"Resize failed: {e}")
+
+
+# Preference order; the first available one is the equivalence reference
+BACKENDS = {b.name: b for b in (NumpyBackend(), OpenCVDnnBackend(), PILBackend())}
+
+_active_backend = None
+_backend_lock = threading.Lock()
+
+
+def machine_key():
+    """Identify the CPU so a shared models/ folder keeps per-machine choices."""
+    return f"{platform.machine()}-{platform.processor() or 'cpu'}-{os.cpu_count()}"
+
+
+def _load_backend_choices():
+    if os.path.isfile(BACKEND_CHOICE_FILE):
+        try:
+            with open(BACKEND_CHOICE_FILE, 'r') as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {}
+
+
+def reference_backend():
+    """Name of the first available backend, the equivalence reference."""
+    return next(n for n, b in BACKENDS.items() if b.is_available())
+
+
+def _write_validation_sources(directory, size):
+    """
+    Write the synthetic images validate_backend() compares on: 8-bit
+    color and grayscale PNGs and JPEGs (the JPEGs large enough for a
+    reduced decode) and a 16-bit grayscale PNG. Returns their paths.
+    """
+    rng = np.random.default_rng(0)
+    width, height = size
+    # Not a multiple of the input size, so every resampling step is exercised
+    shape = (height * 3 // 2 + 7, width * 3 // 2 + 5)
+    large = (shape[0] * 2 + 3, shape[1] * 2 + 1)
+    sources = {
+        'color.png': rng.integers(0, 256, size=shape + (3,), dtype=np.uint8),
+        'gray.png': rng.integers(0, 256, size=shape, dtype=np.uint8),
+        'color.jpg': rng.integers(0, 256, size=large + (3,), dtype=np.uint8),
+        'gray.jpg': rng.integers(0, 256, size=large, dtype=np.uint8),
+        'gray16.png': rng.integers(0, 65536, size=shape, dtype=np.uint16),
+    }
+    paths = []
+    for name, pixels in sources.items():
+        path = os.path.join(directory, name)
+        Image.fromarray(pixels).save(path, **({'quality': 90} if name.endswith('.jpg') else {}))
+        paths.append(path)
+    return paths
+
+
+def validate_backend(name, spec):
+    """
+    Largest absolute difference between a backend's tensors and the
+    reference backend's for spec, over the synthetic sources of
+    _write_validation_sources(). 0.0 for the reference itself.
+    """
+    reference = reference_backend()
+    if name == reference:
+        return 0.0
+    transform = compile_transform(spec)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = _write_validation_sources(tmp, transform.size)
+        out = transform(paths, backend=name).astype(np.float32)
+        expected = transform(paths, backend=reference).astype(np.float32)
+    return float(np.max(np.abs(out - expected)))
+
+
+def benchmark_backends(repeats=5):
+    """
+    Time every available backend on a synthetic oversized grayscale film
+    and check its output against the reference backend.
+
+    Returns
+    -------
+    dict
+        {name: {'ms': median ms per image, 'max_abs_diff': float,
+                'equivalent': bool}}
+    """
+    # Noisy, non power-of-two size so every resampling step is exercised
+    rng = np.random.default_rng(0)
+    film = Image.fromarray(rng.integers(0, 256, size=(2400, 2000), dtype=np.uint8))
+
+    results = {}
+    reference = None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'benchmark.jpg')
+        film.save(path, quality=90)
+        for name, backend in BACKENDS.items():
+            if not backend.is_available():
+                continue
+            out = allocate_batch(1)
+            try:
+                preprocess_images([path], out=out, backend=name)  # warm-up
+            except Exception:
+                continue
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                preprocess_images([path], out=out, backend=name)
+                samples.append((time.perf_counter() - start) * 1000.0)
+            if reference is None:
+                reference = out.copy()
+            diff = float(np.max(np.abs(out - reference)))
+            results[name] = {
+                'ms': float(np.median(samples)),
+                'max_abs_diff': diff,
+                'equivalent': diff <= EQUIVALENCE_ATOL,
+            }
+    return results
+
+
+def select_backend(force=False):
+    """
+    Return the active backend name. The first call on a machine runs
+    benchmark_backends() and persists the fastest equivalent backend in
+    BACKEND_CHOICE_FILE; later calls and runs reuse it. force=True
+    re-benchmarks.
+    """
+    global _active_backend
+    with _backend_lock:
+        if _active_backend is not None and not force:
+            return _active_backend
+
+        key = machine_key()
+        choices = _load_backend_choices()
+        saved = choices.get(key, {}).get('backend')
+        if not force and saved in BACKENDS and BACKENDS[saved].is_available():
+            _active_backend = saved
+            return saved
+
+        results = benchmark_backends()
+        candidates = {n: r for n, r in results.items() if r['equivalent']}
+        if candidates:
+            name = min(candidates, key=lambda n: candidates[n]['ms'])
+        else:
+            name = reference_backend()
+        if name in results and not results[name]['equivalent']:
+            warnings.warn(f"Preprocessing backend '{name}' differs from the reference "
+                          f"by up to {results[name]['max_abs_diff']:.4f}")
+
+        choices[key] = {
+            'backend': name,
+            'results': results,
+            'benchmarked_at': datetime.now().isoformat(),
+        }
+        try:
+            os.makedirs(os.path.dirname(BACKEND_CHOICE_FILE), exist_ok=True)
+            with open(BACKEND_CHOICE_FILE, 'w') as f:
+                json.dump(choices, f, indent=2)
+        except Exception:
+            pass
+        _active_backend = name
+        return name
+
+
+def load_preview_image(file_path, max_size):
+    """
+    Open an image for on-screen preview, scaled down to fit max_size.
+    JPEGs are decoded at a reduced scale via PIL draft() before the
+    final LANCZOS resize, so large films are never fully decoded.
+    16-bit grayscale PNGs are windowed to 8 bits instead of truncated.
+    Returns a PIL.Image.
+    """
+    img = Image.open(file_path)
+    if img.format == 'JPEG':
+        img.draft(img.mode, max_size)
+    elif _is_16bit_mode(img.mode):
+        # PIL cannot reduce 16-bit images; window first, then thumbnail
+        img = Image.fromarray(window_to_uint8(np.asarray(img).astype(np.uint16, copy=False)))
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+    return img
+
+
+class PreprocessTransform:
+    """
+    A PreprocessSpec compiled into a ready-to-run transform: the
+    normalization LUT and cv2.dnn constants are derived once, so every
+    call only decodes, resizes and gathers.
+    """
+
+    def __init__(self, spec):
+        if spec.channels not in (1, 3):
+            raise ValueError(f"Unsupported channel count {spec.channels}. Use 1 or 3.")
+        self.spec = spec
+        self.size = tuple(spec.size)
+        self.channels = spec.channels
+        self.raw = spec.raw
+        self.rgb = spec.channel_order == 'RGB'
+        self.lut = _build_normalization_lut(spec.mean, spec.std)
+        self.blob_mean = tuple(255.0 * m for m in spec.mean)
+        self.blob_scale = tuple(1.0 / (255.0 * s) for s in spec.std)
+        self.stages = spec.stages
+        self.window = spec.window
+        if cv2 is None and any(stage[0] == STAGE_CLAHE for stage in spec.stages):
+            raise ValueError("The CLAHE stage requires OpenCV.")
+        # Reference CDFs are loaded now so a bad reference fails at compile time
+        self._reference_cdfs = {
+            stage[1]: _reference_cdf(stage[1], self.size)
+            for stage in spec.stages if stage[0] == STAGE_HISTOGRAM_MATCHING
+        }
+        self.dtype = np.uint8 if spec.raw else np.float32
+        self._backend = None  # (select_backend() choice, backend used for this spec)
+        width, height = self.size
+        if spec.raw:
+            self.sample_shape = (height, width, spec.channels)
+        else:
+            self.sample_shape = (spec.channels, height, width)
+
+    def prepare(self, image):
+        """
+        Finish a resized image as uint8: window 16-bit data, then run the
+        optional CLAHE / histogram matching stages.
+        """
+        if image.dtype != np.uint8:
+            image = window_to_uint8(image, self.window)
+        for stage in self.stages:
+            if stage[0] == STAGE_CLAHE:
+                clahe = _get_clahe(stage[1], stage[2])
+                if image.ndim == 2:
+                    image = clahe.apply(image)
+                else:
+                    image = cv2.merge([clahe.apply(plane) for plane in cv2.split(image)])
+            elif stage[0] == STAGE_HISTOGRAM_MATCHING:
+                image = _match_histogram(image, self._reference_cdfs[stage[1]])
+        return image
+
+    def backend(self):
+        """
+        Name of the backend this spec runs on: select_backend()'s choice if
+        validate_backend() finds it equivalent for the spec, else the
+        reference. The benchmark only covers the default spec.
+        """
+        chosen = select_backend()
+        if self._backend is None or self._backend[0] != chosen:
+            name = chosen
+            diff = validate_backend(chosen, self.spec)
+            if diff > EQUIVALENCE_ATOL:
+                name = reference_backend()
+                warnings.warn(f"Preprocessing backend '{chosen}' differs from the reference "
+                              f"by up to {diff:.4f} for {self.spec}; using '{name}'")
+            self._backend = (chosen, name)
+        return self._backend[1]
+
+    def allocate(self, n):
+        """Return an uninitialized contiguous buffer for n inputs."""
+        return np.empty((n,) + self.sample_shape, dtype=self.dtype)
+
+    def __call__(self, paths, out=None, timings=None, backend=None):
+        """
+        Preprocess paths into `out` (allocated when omitted) and return the
+        view holding len(paths) inputs. See preprocess_images().
+        """
+        n = len(paths)
+        if out is None:
+            out = self.allocate(n)
+        elif (out.dtype != self.dtype or out.ndim != 4
+              or out.shape[0] < n or out.shape[1:] != self.sample_shape
+              or not out.flags.c_contiguous):
+            raise ValueError(
+                f"Output buffer must be C-contiguous {np.dtype(self.dtype).name} of shape "
+                f"(>={n},{','.join(map(str, self.sample_shape))}), got {out.dtype} {out.shape}."
+            )
+
+        impl = BACKENDS[backend or self.backend()]
+        for i, path in enumerate(paths):
+            _check_extension(path)
+            if self.raw:
+                image = impl.load(path, self, timings)
+                # Gray planes broadcast into every channel of the NHWC slot
+                np.copyto(out[i], image[:, :, None] if image.ndim == 2 else image)
+            else:
+                impl.normalize_into(path, out[i], self, timings)
+
+        return out[:n]
+
+
+@lru_cache(maxsize=None)
+def compile_transform(spec):
+    """Return the PreprocessTransform for spec, compiling it only once."""
+    return PreprocessTransform(spec)
+
+
+def get_transform(session):
+    """
+    Return the compiled transform for a loaded model. The spec is read from
+    the session on first use and the transform is cached on the session.
+    """
+    transform = getattr(session, '_preprocess_transform', None)
+    if transform is None:
+        transform = compile_transform(spec_from_session(session))
+        session._preprocess_transform = transform
+    return transform
+
+
+def allocate_batch(n, channels=3, raw=False):
+    """
+    Return an uninitialized contiguous input buffer for the default spec:
+    (n,C,H,W) float32, or (n,H,W,C) uint8 when raw is True.
+    """
+    return compile_transform(default_spec(channels, raw)).allocate(n)
+
+
+def preprocess_images(paths, out=None, timings=None, channels=3, raw=False, backend=None):
+    """
+    Load and preprocess several images into one contiguous batch using the
+    default spec (256x256 BGR, ImageNet statistics); models with their own
+    spec go through get_transform(session) instead.
+    Each image is resized as uint8 and then normalized through a
+    256-entry lookup table per channel, written straight into `out`
+    (no float temporaries per image). Grayscale sources stay single
+    channel through decode and resize; the expansion to 3 channels
+    happens in the final LUT gather.
+
+    With raw=True the resized uint8 pixels are written as NHWC without
+    normalization, for models whose graph performs it (see
+    ModelOptimization.fold_preprocessing).
+
+    Parameters
+    ----------
+    paths : sequence of str
+        Image file paths (.jpg/.jpeg/.png).
+    out : numpy.ndarray, optional
+        Reusable C-contiguous buffer from allocate_batch() with
+        N >= len(paths). Allocated when omitted.
+    timings : list, optional
+        When given, one dict per image is appended with the decode scale,
+        source/decoded sizes, decode time in ms and the fraction of source
+        pixels skipped by reduced-resolution decoding.
+    channels : int
+        Channels the model expects: 3 (BGR, ImageNet statistics) or 1
+        (grayscale, GRAYSCALE_MEAN/GRAYSCALE_STD).
+    raw : bool
+        Produce uint8 (N,256,256,C) pixels instead of normalized float32.
+    backend : str, optional
+        Name from BACKENDS; defaults to the transform's backend() (the one
+        chosen by select_backend(), if equivalent for the spec).
+
+    Returns
+    -------
+    numpy.ndarray
+        View of `out` holding the len(paths) preprocessed images.
+
+    Raises
+    ------
+    ValueError on load or resize failure, or on an unsuitable buffer.
+    """
+    transform = compile_transform(default_spec(channels, raw))
+    return transform(paths, out=out, timings=timings, backend=backend)
+
+
+def preprocess_image(file_path, channels=3):
     """
     Load and preprocess an image for model inference.
     Steps:
       1. Verify extension (.jpg/.jpeg/.png).
-      2. Read image in BGR color.
+      2. Read image in BGR color, or as one channel for grayscale sources
+         (reduced-scale decode for large JPEGs).
       3. Resize to 256×256.
       4. Scale pixel values to [0,1].
       5. Normalize using ImageNet mean/std.
-      6. Convert HWC→CHW and add batch dim → (1,3,256,256).
+      6. Convert HWC→CHW and add batch dim → (1,C,256,256).
     Returns:
       numpy.ndarray of dtype float32.
     Raises:
       ValueError on load or resize failure.
     """
-    valid_exts = {".jpg", ".jpeg", ".png"}
-    _, ext = os.path.splitext(file_path)
-    ext = ext.lower()
-    if ext not in valid_exts:
-        raise ValueError(f"Unsupported extension '{ext}'. Use JPG or PNG.")
-    
-    image = cv2.imread(file_path, cv2.IMREAD_COLOR)
-    if image is None:
-        raise ValueError(f"Cannot load image at '{file_path}'.")
-    
-    try:
-        image = cv2.resize(image, (256, 256))
-    except Exception as e:
-        raise ValueError(f"Resize failed: {e}")
-    
-    image = image.astype(np.float32) / 255.0
-    # HWC → CHW
-    image = image.transpose(2, 0, 1)
-    
-    # ImageNet normalization
-    mean = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(3,1,1)
-    std  = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(3,1,1)
-    image = (image - mean) / std
-    
-    # Add batch dimension
-    return np.expand_dims(image, axis=0)
+    return preprocess_images([file_path], channels=channels)
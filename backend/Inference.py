@@ -1,7 +1,232 @@
 # backend/Inference.py
 
+import threading
+from collections import OrderedDict
+
 import numpy as np
 
+from .ModelOptimization import META_OUTPUT_PROBABILITIES
+
+def is_raw_input(session):
+    """
+    True when the model takes uint8 NHWC pixels, i.e. normalization was
+    folded into the graph at import time.
+    """
+    return session.get_inputs()[0].type == 'tensor(uint8)'
+
+def get_input_channels(session):
+    """
+    Return the channel count of the model input (axis 1 of NCHW, or
+    axis 3 for raw NHWC inputs).
+    Falls back to 3 when the dimension is symbolic or unknown.
+    """
+    shape = session.get_inputs()[0].shape
+    axis = 3 if is_raw_input(session) else 1
+    if len(shape) == 4 and isinstance(shape[axis], int):
+        return shape[axis]
+    return 3
+
+def outputs_probabilities(session):
+    """
+    True when the graph already ends in a Softmax (recorded in the model
+    metadata by ModelOptimization.fold_preprocessing). Cached on the session.
+    """
+    flag = getattr(session, '_outputs_probabilities', None)
+    if flag is None:
+        meta = session.get_modelmeta().custom_metadata_map
+        flag = meta.get(META_OUTPUT_PROBABILITIES) == '1'
+        session._outputs_probabilities = flag
+    return flag
+
+def get_batch_limit(session):
+    """
+    Return the fixed batch size of the model input, or None when the batch
+    axis is dynamic. Cached on the session.
+    """
+    limit = getattr(session, '_batch_limit', 0)
+    if limit == 0:
+        shape = session.get_inputs()[0].shape
+        limit = shape[0] if shape and isinstance(shape[0], int) and shape[0] > 0 else None
+        session._batch_limit = limit
+    return limit
+
+def softmax_rows(logits):
+    """Numerically stable softmax over the last axis of a (N, K) array."""
+    exp_logits = np.exp(logits - logits.max(axis=1, keepdims=True))
+    exp_logits /= exp_logits.sum(axis=1, keepdims=True)
+    return exp_logits
+
+# ONNX element types with a numpy equivalent we can preallocate
+_ORT_DTYPES = {
+    'tensor(float)': np.float32,
+    'tensor(double)': np.float64,
+    'tensor(float16)': np.float16,
+    'tensor(uint8)': np.uint8,
+}
+
+class InferenceEngine:
+    """
+    Run a loaded session through an IOBinding.
+
+    Input/output names, shapes and dtypes are resolved once. Output arrays
+    are preallocated per batch size and bound as OrtValues that wrap them,
+    so ONNX Runtime writes results in place instead of allocating new
+    arrays on every run. A lock serialises callers because an IOBinding
+    is not safe to share between threads.
+    """
+
+    MAX_OUTPUT_BUFFERS = 4  # Distinct batch sizes kept preallocated
+
+    def __init__(self, session):
+        self.session = session
+        model_input = session.get_inputs()[0]
+        model_output = session.get_outputs()[0]
+        self.input_name = model_input.name
+        self.input_shape = model_input.shape
+        self.input_dtype = _ORT_DTYPES.get(model_input.type, np.float32)
+        self.output_name = model_output.name
+        self.output_dtype = _ORT_DTYPES.get(model_output.type)
+        self.batch_limit = get_batch_limit(session)
+        self.probabilities = outputs_probabilities(session)
+
+        # Per-sample output shape, if every non-batch dimension is static
+        sample = model_output.shape[1:]
+        if self.output_dtype is not None and all(isinstance(d, int) and d > 0 for d in sample):
+            self.output_sample_shape = tuple(sample)
+        else:
+            self.output_sample_shape = None
+
+        self._binding = session.io_binding()
+        self._outputs = OrderedDict()  # batch size -> (array, OrtValue)
+        self._lock = threading.Lock()
+        # Set once a run has completed, i.e. lazy allocations are done
+        self.ready = threading.Event()
+
+    def _output_buffer(self, n):
+        # Imported here: preprocessing worker processes import this module
+        # and have no use for ONNX Runtime.
+        from onnxruntime import OrtValue
+
+        entry = self._outputs.get(n)
+        if entry is None:
+            array = np.empty((n,) + self.output_sample_shape, dtype=self.output_dtype)
+            entry = (array, OrtValue.ortvalue_from_numpy(array))
+            self._outputs[n] = entry
+            while len(self._outputs) > self.MAX_OUTPUT_BUFFERS:
+                self._outputs.popitem(last=False)
+        else:
+            self._outputs.move_to_end(n)
+        return entry
+
+    def run(self, batch, run_options=None):
+        """
+        Run one (N, ...) input through the session and return the first
+        output reshaped to (N, -1). The array is a fresh copy.
+        Setting run_options.terminate from another thread aborts the run.
+        """
+        batch = np.ascontiguousarray(batch, dtype=self.input_dtype)
+        n = len(batch)
+        with self._lock:
+            binding = self._binding
+            binding.bind_cpu_input(self.input_name, batch)
+            if self.output_sample_shape is not None:
+                array, value = self._output_buffer(n)
+                binding.bind_ortvalue_output(self.output_name, value)
+                self.session.run_with_iobinding(binding, run_options)
+                out = array.reshape(n, -1).copy()
+            else:
+                binding.bind_output(self.output_name, 'cpu')
+                self.session.run_with_iobinding(binding, run_options)
+                out = binding.copy_outputs_to_cpu()[0].reshape(n, -1)
+            binding.clear_binding_inputs()
+            binding.clear_binding_outputs()
+        self.ready.set()
+        return out
+
+    def warm_up(self, sample, run_options=None):
+        """
+        Run a synthetic input once so lazy allocations and kernel setup
+        happen now rather than on the first real request.
+        
+        Returns True once the engine is ready, False if cancelled through
+        run_options.terminate (before or during the run).
+        """
+        if self.ready.is_set():
+            return True
+        if run_options is not None and run_options.terminate:
+            return False
+        try:
+            self.run(sample, run_options)
+        except Exception:
+            if run_options is not None and run_options.terminate:
+                return False
+            raise
+        return True
+
+    def predict(self, batch, max_batch=None):
+        """
+        Predict (N, num_classes) probabilities for a batch of preprocessed
+        images, see predict_batch.
+        """
+        n = len(batch)
+        if n == 0:
+            # Nothing to run; 0 columns if the output shape is symbolic
+            classes = int(np.prod(self.output_sample_shape)) if self.output_sample_shape else 0
+            return np.zeros((0, classes), dtype=np.float32)
+        chunk = self.batch_limit or max_batch or n
+
+        outputs = []
+        for start in range(0, n, chunk):
+            part = batch[start:start + chunk]
+            count = len(part)
+            if self.batch_limit and count < chunk:
+                padded = np.zeros((chunk,) + part.shape[1:], dtype=part.dtype)
+                padded[:count] = part
+                part = padded
+            outputs.append(self.run(part)[:count])
+        logits = outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+        if self.probabilities:
+            return logits
+        return softmax_rows(logits.astype(np.float32, copy=False))
+
+    def predict_image(self, image_input):
+        """Probability vector for a single (1, ...) preprocessed image."""
+        return self.predict(image_input)[0]
+
+def get_engine(session):
+    """Return the InferenceEngine for a session, creating it on first use."""
+    engine = getattr(session, '_engine', None)
+    if engine is None:
+        engine = InferenceEngine(session)
+        session._engine = engine
+    return engine
+
+def predict_batch(session, batch, max_batch=None):
+    """
+    Predict classification probabilities for a batch of preprocessed images.
+
+    Models with a dynamic batch axis run the whole batch (or chunks of
+    `max_batch`) in one call; models with a fixed batch size are fed in
+    chunks of that size, padding the last one.
+
+    Parameters
+    ----------
+    session : onnxruntime.InferenceSession
+        ONNX Runtime session.
+    batch : numpy.ndarray
+        Input tensor of shape (N, C, H, W), dtype float32, or
+        (N, H, W, C) uint8 for models with folded preprocessing.
+    max_batch : int, optional
+        Upper bound on images per session.run for dynamic models.
+
+    Returns
+    -------
+    numpy.ndarray
+        (N, num_classes) softmax probabilities.
+    """
+    return get_engine(session).predict(batch, max_batch)
+
 def predict_image(session, image_input):
     """
     Predict classification probabilities for a preprocessed image.
@@ -11,19 +236,12 @@ def predict_image(session, image_input):
     session : onnxruntime.InferenceSession
         ONNX Runtime session.
     image_input : numpy.ndarray
-        Input tensor of shape (1, C, H, W), dtype float32.
+        Input tensor of shape (1, C, H, W), dtype float32, or
+        (1, H, W, C) uint8 for models with folded preprocessing.
 
     Returns
     -------
     numpy.ndarray
         Softmax probability vector for each class.
     """
-    # Get input name for the session
-    input_name = session.get_inputs()[0].name
-    # Run inference
-    outputs = session.run(None, {input_name: image_input})
-    logits = outputs[0].flatten()
-    # Compute softmax with numerical stability
-    exp_logits = np.exp(logits - np.max(logits))
-    probabilities = exp_logits / np.sum(exp_logits)
-    return probabilities
+    return get_engine(session).predict_image(image_input)
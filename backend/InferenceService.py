@@ -0,0 +1,157 @@
+# backend/InferenceService.py
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from .Inference import get_engine
+
+# Sentinel that tells the worker thread to exit once the queue is empty
+_STOP = object()
+
+_service_lock = threading.Lock()
+
+
+class InferenceService:
+    """
+    One long-lived worker thread per loaded model.
+
+    Callers submit preprocessed (n, ...) tensors and get a Future of the
+    (n, num_classes) probabilities. Requests that arrive within
+    `batch_window` seconds of each other are coalesced into one batched
+    run of up to `max_batch` images, so the Classify tab, evaluations and
+    folder drops share the session instead of competing for it.
+    A submitted tensor must not be modified until its future completes.
+
+    The worker exits after IDLE_TIMEOUT seconds without work (or on stop())
+    and is restarted by the next submit, so a service never keeps an
+    evicted session alive and late callers are still served.
+    """
+
+    BATCH_WINDOW = 0.003  # Seconds to wait for more requests to join a batch
+    MAX_BATCH = 8
+    IDLE_TIMEOUT = 30.0
+
+    def __init__(self, session, max_batch=None, batch_window=None):
+        self.engine = get_engine(session)
+        self.max_batch = max_batch or self.MAX_BATCH
+        self.batch_window = self.BATCH_WINDOW if batch_window is None else batch_window
+        self.stats = {'requests': 0, 'runs': 0}
+        self._queue = queue.Queue()
+        self._buffer = None  # Reused when several requests are coalesced
+        self._lock = threading.Lock()  # Guards worker start/exit
+        self._thread = None
+
+    def submit(self, tensor):
+        """Queue a (n, ...) input; returns a Future of (n, num_classes)."""
+        future = Future()
+        with self._lock:
+            self._queue.put((tensor, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._serve, daemon=True)
+                self._thread.start()
+        return future
+
+    def predict(self, tensor, timeout=None):
+        """Submit and wait for the result."""
+        return self.submit(tensor).result(timeout)
+
+    def stop(self):
+        """Let the worker exit as soon as everything queued is done."""
+        self._queue.put(_STOP)
+
+    @property
+    def busy(self):
+        """True while the worker thread runs, i.e. within IDLE_TIMEOUT of a request."""
+        return self._thread is not None
+
+    def _serve(self):
+        carry = None
+        while True:
+            if carry is not None:
+                item, carry = carry, None
+            else:
+                try:
+                    item = self._queue.get(timeout=self.IDLE_TIMEOUT)
+                except queue.Empty:
+                    item = _STOP
+            if item is _STOP:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+
+            requests = [item]
+            count = len(item[0])
+            deadline = time.monotonic() + self.batch_window
+            while count < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        pending = self._queue.get(timeout=timeout)
+                    else:
+                        pending = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if (pending is _STOP or count + len(pending[0]) > self.max_batch
+                        or not self._compatible(item[0], pending[0])):
+                    carry = pending  # Runs first next round
+                    break
+                requests.append(pending)
+                count += len(pending[0])
+
+            self._run(requests)
+
+    @staticmethod
+    def _compatible(a, b):
+        return a.shape[1:] == b.shape[1:] and a.dtype == b.dtype
+
+    def _run(self, requests):
+        live = [(t, f) for t, f in requests if f.set_running_or_notify_cancel()]
+        if not live:
+            return
+
+        if len(live) == 1:
+            batch = live[0][0]
+        else:
+            first = live[0][0]
+            count = sum(len(t) for t, _ in live)
+            if (self._buffer is None or self._buffer.shape[1:] != first.shape[1:]
+                    or self._buffer.dtype != first.dtype):
+                self._buffer = np.empty((self.max_batch,) + first.shape[1:], dtype=first.dtype)
+            batch = np.concatenate([t for t, _ in live], out=self._buffer[:count])
+
+        self.stats['requests'] += len(live)
+        self.stats['runs'] += 1
+        try:
+            probs = self.engine.predict(batch, max_batch=self.max_batch)
+        except Exception as e:
+            for _, future in live:
+                future.set_exception(e)
+            return
+
+        start = 0
+        for tensor, future in live:
+            future.set_result(probs[start:start + len(tensor)])
+            start += len(tensor)
+
+
+def get_service(session):
+    """Return the session's InferenceService, starting it on first use."""
+    with _service_lock:
+        service = getattr(session, '_service', None)
+        if service is None:
+            service = InferenceService(session)
+            session._service = service
+        return service
+
+
+def stop_service(session):
+    """Release the worker thread of the session's InferenceService."""
+    service = getattr(session, '_service', None)
+    if service is not None:
+        service.stop()
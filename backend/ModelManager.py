@@ -1,26 +1,77 @@
 # backend/ModelManager.py
 
+import atexit
 import onnxruntime
 import os
 import shutil
 import json
 import hashlib
+import re
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from collections import OrderedDict
 
+import numpy as np
+
+from .ImagePreprocessing import (IMAGENET_MEAN, IMAGENET_STD, compile_transform,
+                                 machine_key, parse_stages, spec_from_session)
+from .CompositeModels import (
+    COMPOSITE_CASCADE, COMPOSITE_ENSEMBLE, DEFAULT_CASCADE_THRESHOLD,
+    ENSEMBLE_AVERAGE, ENSEMBLE_METHODS, CascadeModel, EnsembleModel
+)
+from .Evaluation import evaluate_model, list_dataset
+from .Inference import get_engine
+from .InferenceService import stop_service
+from .ReplicaPool import ReplicaPool, plan_replicas
+from .SessionProfiles import (PURPOSE_LATENCY, PURPOSE_THROUGHPUT, autotune, benchmark_isolated,
+                              make_session_options, process_rss, profile_key, profile_operators)
+from .ModelOptimization import (fold_preprocessing, make_batch_dynamic, quantize_model,
+                                validate_dynamic_batch, INPUT_FORMAT_UINT8_NHWC,
+                                QUANTIZATION_DYNAMIC, QUANTIZATION_STATIC)
+
 class ModelManager:
     MODELS_DIR = "models"
     REGISTRY_FILE = os.path.join(MODELS_DIR, "model_registry.json")
-    MAX_LOADED_MODELS = 2  # Maximum models to keep in memory
+    HASH_CACHE_FILE = os.path.join(MODELS_DIR, "hash_cache.json")  # path -> size, mtime, sha256
+    OPTIMIZED_DIR = os.path.join(MODELS_DIR, "optimized")  # Pre-optimized graphs
+    MEMORY_BUDGET_MB = 768  # Resident memory loaded sessions may use together
+    IDLE_UNLOAD_SECONDS = 20 * 60  # Release sessions unused for this long
+    IDLE_CHECK_SECONDS = 60
+    ARENA_FRACTION = 0.5  # Arena estimate (x file size) before a cost is measured
+    CALIBRATION_PER_CLASS = 25  # Images per class for calibration/quick checks
+    COPY_CHUNK_SIZE = 4 * 1024 * 1024  # Read size when copying/hashing model files
 
     def __init__(self):
         os.makedirs(self.MODELS_DIR, exist_ok=True)
         self.models = OrderedDict()  # ONNX sessions (LRU cache)
+        self._costs = {}             # model name -> measured resident bytes
+        self._last_used = {}         # model name -> time.monotonic() of last use
+        self._lock = threading.RLock()  # Guards the session cache and registry writes
+        self._leases = {}            # model name -> sessions handed out by acquire_model
+        self._reaper = None          # Idle-release thread, runs while models are loaded
+        self._loading = {}           # model name -> Future of an in-flight load
+        self._loader = None          # Background loader, see load_model_async
+        self.composites = {}         # Cascade/ensemble stand-ins; hold no sessions
         self.model_registry = {}     # Model metadata
+        self._hash_cache = {}        # See HASH_CACHE_FILE
         self.current_model_name = None
+        self._warmups = {}           # model name -> RunOptions of its warm-up
+        self._warmup_threads = set() # Running warm-ups, joined by close()
+        # Called as ready_callback(model_name) from a worker thread once a
+        # freshly loaded model has finished warming up
+        self.ready_callback = None
         
         # Load registry
         self._load_registry()
+        self._load_hash_cache()
+        
+        # ONNX Runtime aborts the process if the interpreter exits while a
+        # warm-up is still inside session.run
+        atexit.register(self.close)
 
     def _load_registry(self):
         """Load model registry from file"""
@@ -36,18 +87,108 @@ class ModelManager:
     def _save_registry(self):
         """Save model registry to file"""
         try:
-            with open(self.REGISTRY_FILE, 'w') as f:
+            # Loader threads save too; serialize so no one dumps a half update
+            with self._lock, open(self.REGISTRY_FILE, 'w') as f:
                 json.dump(self.model_registry, f, indent=2)
         except Exception:
             pass
 
-    def _calculate_file_hash(self, file_path):
-        """Calculate SHA256 hash of file"""
+    def _load_hash_cache(self):
+        """Load cached file hashes"""
+        try:
+            with open(self.HASH_CACHE_FILE, 'r') as f:
+                self._hash_cache = json.load(f)
+        except Exception:
+            self._hash_cache = {}
+
+    def _save_hash_cache(self):
+        """Save cached file hashes, dropping files that no longer exist"""
+        # Imports hash on worker threads; prune and dump under the lock so
+        # a concurrent _remember_hash cannot change the dict mid-iteration
+        with self._lock:
+            self._hash_cache = {path: entry for path, entry in self._hash_cache.items()
+                                if os.path.isfile(path)}
+            snapshot = dict(self._hash_cache)
+            try:
+                with open(self.HASH_CACHE_FILE, 'w') as f:
+                    json.dump(snapshot, f, indent=2)
+            except Exception:
+                pass
+
+    def _cached_hash(self, file_path):
+        """SHA256 of a file from the cache if its size and mtime still match"""
+        stat = os.stat(file_path)
+        with self._lock:
+            entry = self._hash_cache.get(os.path.abspath(file_path))
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+        return None
+
+    def _remember_hash(self, file_path, file_hash):
+        stat = os.stat(file_path)
+        with self._lock:
+            self._hash_cache[os.path.abspath(file_path)] = {
+                'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_hash
+            }
+            self._save_hash_cache()
+
+    def _calculate_file_hash(self, file_path, progress=None):
+        """
+        Calculate SHA256 hash of file, cached by (path, size, mtime).
+        progress(done_bytes, total_bytes) is called while reading.
+        """
+        cached = self._cached_hash(file_path)
+        if cached:
+            return cached
+        
         sha256_hash = hashlib.sha256()
+        total = os.path.getsize(file_path)
+        done = 0
         with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
+            for byte_block in iter(lambda: f.read(self.COPY_CHUNK_SIZE), b""):
                 sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+                done += len(byte_block)
+                if progress is not None:
+                    progress(done, total)
+        file_hash = sha256_hash.hexdigest()
+        self._remember_hash(file_path, file_hash)
+        return file_hash
+
+    def _copy_and_hash(self, src, dest, progress=None):
+        """
+        Copy a file in one streaming pass, hashing it on the way; returns
+        the SHA256. progress(done_bytes, total_bytes) is called per chunk.
+        """
+        sha256_hash = hashlib.sha256()
+        total = os.path.getsize(src)
+        done = 0
+        buffer = bytearray(self.COPY_CHUNK_SIZE)
+        view = memoryview(buffer)
+        with open(src, "rb") as fin, open(dest, "wb") as fout:
+            while True:
+                count = fin.readinto(buffer)
+                if not count:
+                    break
+                sha256_hash.update(view[:count])
+                fout.write(view[:count])
+                done += count
+                if progress is not None:
+                    progress(done, total)
+        shutil.copystat(src, dest)
+        
+        file_hash = sha256_hash.hexdigest()
+        self._remember_hash(src, file_hash)
+        return file_hash
+
+    def _find_model_by_hash(self, file_hash):
+        """Name of a registered model file with this content, or None"""
+        with self._lock:
+            for name, info in self.model_registry.items():
+                if info.get('composite') or not os.path.isfile(info['path']):
+                    continue
+                if file_hash in (info.get('hash'), info.get('source_hash')):
+                    return name
+        return None
 
     def register_and_load_model(self, file_path):
         """Register a model and optionally load it"""
@@ -59,73 +200,841 @@ class ModelManager:
         
         # Check if already registered
         if model_name not in self.model_registry:
-            # Calculate file hash
+            # Calculate file hash (outside the lock; it reads the whole file)
             file_hash = self._calculate_file_hash(file_path)
             
             # Register model
-            self.model_registry[model_name] = {
-                'path': file_path,
-                'name': model_name,
-                'hash': file_hash,
-                'registered_at': datetime.now().isoformat(),
-                'last_used': None,
-                'use_count': 0
-            }
-            self._save_registry()
+            with self._lock:
+                if model_name not in self.model_registry:
+                    self.model_registry[model_name] = {
+                        'path': file_path,
+                        'name': model_name,
+                        'hash': file_hash,
+                        'registered_at': datetime.now().isoformat(),
+                        'last_used': None,
+                        'use_count': 0
+                    }
+                    self._save_registry()
         
         return model_name
 
-    def import_model(self, file_path):
-        """Copy ONNX file into models/ and register it"""
+    def import_model(self, file_path, fold_preprocessing=False, quantize=None,
+                     dataset_path=None, class_names=None, progress=None):
+        """
+        Copy ONNX file into models/ and register it.
+        A model exported with a fixed batch size is replaced by a variant
+        with a symbolic batch axis when that gives the same outputs (see
+        _enable_batching); 'supports_batching' records the outcome.
+        The file is copied and hashed in a single pass (progress(done_bytes,
+        total_bytes) is called while copying); if a registered model already
+        has the same content, that model is used instead of a new copy.
+        With fold_preprocessing, also register a derived model that takes
+        raw uint8 NHWC pixels and outputs probabilities, and return its name.
+        With quantize ('dynamic' or 'static'), also register an INT8 variant
+        of the returned model (see create_quantized_model) and return that.
+        """
         if not os.path.isfile(file_path):
             raise FileNotFoundError(f"Model file not found: {file_path}")
         
         basename = os.path.basename(file_path)
         dest = os.path.join(self.MODELS_DIR, basename)
         
-        # Copy file if not already in models directory
-        if os.path.abspath(file_path) != os.path.abspath(dest):
-            shutil.copy2(file_path, dest)
+        in_place = os.path.abspath(file_path) == os.path.abspath(dest)
+        partial = dest + ".part"
+        try:
+            # The source hash comes from the cache, the copy, or (for a file
+            # already in models/) a read of the file itself
+            source_hash = self._cached_hash(file_path)
+            if source_hash is None:
+                if in_place:
+                    source_hash = self._calculate_file_hash(file_path, progress)
+                else:
+                    source_hash = self._copy_and_hash(file_path, partial, progress)
+            
+            model_name = self._find_model_by_hash(source_hash)
+            if model_name is None:
+                # Copy file if not already in models directory
+                if not in_place:
+                    if not os.path.isfile(partial):
+                        self._copy_and_hash(file_path, partial, progress)
+                    os.replace(partial, dest)
+                    self._remember_hash(dest, source_hash)
+                    backup = None
+                else:
+                    backup = dest + ".orig"  # Keep the user's file if it is rewritten
+                supports_batching = self._enable_batching(dest, backup)
+                
+                # Register and return name
+                model_name = self.register_and_load_model(dest)
+                file_hash = self._calculate_file_hash(dest)  # Name may be re-imported
+                with self._lock:
+                    entry = self.model_registry[model_name]
+                    entry['hash'] = file_hash
+                    entry['source_hash'] = source_hash
+                    if supports_batching is not None:
+                        entry['supports_batching'] = supports_batching
+                    self._save_registry()
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        
+        if fold_preprocessing:
+            model_name = self.create_fused_model(model_name)
+        if quantize:
+            model_name = self.create_quantized_model(model_name, quantize,
+                                                     dataset_path, class_names)
+        return model_name
+
+    def _enable_batching(self, model_path, backup=None):
+        """
+        Rewrite a fixed-batch model file in place to a symbolic batch axis,
+        keeping the rewrite only if validate_dynamic_batch() passes. The
+        original is copied to `backup` first, if given.
+        Returns whether the file now supports batching, or None if unknown
+        (onnx is not installed).
+        """
+        tmp_path = model_path[:-len(".onnx")] + ".dynamic.tmp.onnx"
+        try:
+            batch = make_batch_dynamic(model_path, tmp_path)
+            if batch is None:
+                return True  # Already dynamic
+            validate_dynamic_batch(model_path, tmp_path, batch)
+            if backup:
+                shutil.copy2(model_path, backup)
+            os.replace(tmp_path, model_path)
+            return True
+        except RuntimeError:
+            return None
+        except Exception as e:
+            warnings.warn(f"Keeping fixed batch for {os.path.basename(model_path)}: {e}")
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def create_fused_model(self, model_name):
+        """Register a variant with normalization and softmax in the graph"""
+        self._require_file_model(model_name)
+        
+        src = self.model_registry[model_name]['path']
+        dest = os.path.join(self.MODELS_DIR, f"{model_name}_fused.onnx")
+        fold_preprocessing(src, dest, IMAGENET_MEAN, IMAGENET_STD)
         
-        # Register and return name
-        return self.register_and_load_model(dest)
+        fused_name = self.register_and_load_model(dest)
+        with self._lock:
+            self.model_registry[fused_name]['derived_from'] = model_name
+            if 'supports_batching' in self.model_registry[model_name]:
+                # The fused graph keeps its source's batch axis
+                self.model_registry[fused_name]['supports_batching'] = \
+                    self.model_registry[model_name]['supports_batching']
+            self.model_registry[fused_name]['input_format'] = INPUT_FORMAT_UINT8_NHWC
+            self._save_registry()
+        return fused_name
 
-    def load_model(self, model_name):
-        """Load model into memory"""
-        if model_name in self.models:
-            # Move to end (LRU)
-            self.models.move_to_end(model_name)
-            return self.models[model_name]
+    def create_quantized_model(self, model_name, mode=QUANTIZATION_DYNAMIC,
+                               dataset_path=None, class_names=None):
+        """
+        Register an INT8 variant of a model and report what it costs.
         
-        if model_name not in self.model_registry:
-            raise ValueError(f"Model not registered: {model_name}")
+        Steps:
+        1. Quantize dynamically, or statically (QDQ) with activation ranges
+           calibrated on up to CALIBRATION_PER_CLASS images per class from
+           dataset_path/class_name folders.
+        2. Register it as <name>_int8 next to the FP32 model.
+        3. Benchmark both for latency and memory and, given a dataset, run a
+           quick evaluation of both on the same sample.
+        
+        The report is stored as 'quantization_report' on the variant's
+        registry entry. Returns the variant's name.
+        """
+        self._require_file_model(model_name)
+        if dataset_path and not class_names:
+            raise ValueError("class_names are required with a dataset")
+        
+        info = self.model_registry[model_name]
+        src = info['path']
+        dest = os.path.join(self.MODELS_DIR, f"{model_name}_int8.onnx")
+        
+        # Session outside the LRU so loaded models stay resident
+        reference = self._create_session(model_name, src)
+        self._compile_transform(model_name, reference)
         
-        model_info = self.model_registry[model_name]
-        model_path = model_info['path']
+        calibration = None
+        if mode == QUANTIZATION_STATIC:
+            if not dataset_path:
+                raise ValueError("Static quantization needs a calibration dataset.")
+            transform = reference._preprocess_transform
+            files = list_dataset(dataset_path, class_names, self.CALIBRATION_PER_CLASS)
+            if not files:
+                raise ValueError("No calibration images found in dataset.")
+            
+            def calibration_inputs():
+                for _, path in files:
+                    try:
+                        yield transform([path])
+                    except Exception:
+                        continue  # Unreadable image: calibrate on the rest
+            calibration = calibration_inputs()
+        quantize_model(src, dest, mode, calibration)
+        
+        quant_name = self.register_and_load_model(dest)
+        file_hash = self._calculate_file_hash(dest)  # File may be rebuilt
+        with self._lock:
+            entry = self.model_registry[quant_name]
+            entry['hash'] = file_hash
+            entry['derived_from'] = model_name
+            entry['quantization'] = mode
+            for key in ('input_format', 'preprocess_stages', 'supports_batching'):
+                if key in info:
+                    entry[key] = info[key]
+            self._save_registry()
+        self._unload(quant_name)
+        
+        # Latency and memory on this machine, same session profile for both
+        profile = self.get_session_profile(model_name)
+        fp32 = benchmark_isolated(src, profile)
+        int8 = benchmark_isolated(dest, profile)
+        report = {
+            'mode': mode,
+            'size_mb': {'fp32': round(os.path.getsize(src) / 2**20, 2),
+                        'int8': round(os.path.getsize(dest) / 2**20, 2)},
+            'latency_ms': {'fp32': round(fp32['latency_ms'], 3),
+                           'int8': round(int8['latency_ms'], 3)},
+            'memory_mb': {'fp32': fp32['memory_mb'] and round(fp32['memory_mb'], 1),
+                          'int8': int8['memory_mb'] and round(int8['memory_mb'], 1)},
+        }
+        
+        if dataset_path:
+            quantized = self._create_session(quant_name, dest)
+            self._compile_transform(quant_name, quantized)
+            accuracy = {}
+            for key, session in (('fp32', reference), ('int8', quantized)):
+                _, metrics = evaluate_model(session, dataset_path, class_names,
+                                            max_per_class=self.CALIBRATION_PER_CLASS)
+                accuracy[key] = round(metrics['accuracy'], 4)
+            stop_service(reference)
+            stop_service(quantized)
+            accuracy['delta'] = round(accuracy['int8'] - accuracy['fp32'], 4)
+            accuracy['images'] = len(list_dataset(dataset_path, class_names,
+                                                  self.CALIBRATION_PER_CLASS))
+            report['accuracy'] = accuracy
+        
+        with self._lock:
+            entry['quantization_report'] = report
+            self._save_registry()
+        return quant_name
+
+    def load_model(self, model_name, prefetch=False):
+        """
+        Load model into memory.
+        
+        Loaded sessions form an LRU cache bounded by MEMORY_BUDGET_MB of
+        measured resident cost (see _estimated_cost); the least recently
+        used are evicted to make room, and sessions idle for
+        IDLE_UNLOAD_SECONDS are released in the background. Leased
+        sessions (see acquire_model) are never evicted.
+        
+        A call for a model that is already loading waits for that load
+        instead of starting another. A prefetch load goes to the cold end
+        of the LRU and does not count as a use.
+        """
+        with self._lock:
+            if model_name in self.models:
+                if not prefetch:
+                    # Move to end (LRU)
+                    self.models.move_to_end(model_name)
+                    self._last_used[model_name] = time.monotonic()
+                return self.models[model_name]
+            
+            if model_name not in self.model_registry:
+                raise ValueError(f"Model not registered: {model_name}")
+            
+            composite = self.model_registry[model_name].get('composite')
+            if not composite:
+                pending = self._loading.get(model_name)
+                owner = pending is None
+                if owner:
+                    pending = self._loading[model_name] = Future()
+                    pending.prefetch = prefetch
+        
+        if composite:
+            return self._load_composite(model_name)
+        if not owner:
+            session = pending.result()
+            if not prefetch:
+                with self._lock:
+                    # Promote a prefetched session the caller actually wants
+                    if self.models.get(model_name) is session:
+                        self.models.move_to_end(model_name)
+                        self._last_used[model_name] = time.monotonic()
+                    if pending.prefetch:
+                        pending.prefetch = False  # Count the use once
+                        self._record_use(model_name)
+            return session
+        
+        try:
+            session = self._load_session(model_name, prefetch)
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set_result(session)
+            return session
+        finally:
+            with self._lock:
+                self._loading.pop(model_name, None)
+
+    def _load_session(self, model_name, prefetch=False):
+        """Create a model's session and add it to the cache"""
+        model_path = self.model_registry[model_name]['path']
         
         if not os.path.isfile(model_path):
             raise FileNotFoundError(f"Model file not found: {model_path}")
         
-        # Check cache size and evict if necessary
-        while len(self.models) >= self.MAX_LOADED_MODELS:
-            # Remove least recently used
-            oldest_name, oldest_session = self.models.popitem(last=False)
-            del oldest_session
+        # Evict least recently used sessions until this one should fit
+        with self._lock:
+            self._enforce_budget(incoming=self._estimated_cost(model_name))
         
-        # Load model
+        # Load model; the lock is not held, so loaded models stay usable
         try:
-            session = onnxruntime.InferenceSession(model_path)
+            rss_before = process_rss()
+            session = self._create_session(model_name, model_path)
             session._model_path = model_path
+            # Compile the model's preprocessing once, next to the session
+            self._compile_transform(model_name, session)
+            # Resolve I/O metadata and set up the IOBinding up front
+            get_engine(session)
+            rss_after = process_rss()
+        except Exception as e:
+            raise RuntimeError(f"Failed to load model {model_name}: {str(e)}")
+        
+        with self._lock:
+            # Resident cost: RSS growth, at least the file-size estimate
+            # (freed heap may be reused); the warm-up adds what the first
+            # run allocates
+            self._costs.pop(model_name, None)
+            cost = self._estimated_cost(model_name)
+            if rss_before is not None and rss_after is not None:
+                cost = max(cost, rss_after - rss_before)
+            self._costs[model_name] = cost
+            
             self.models[model_name] = session
+            if prefetch:
+                self.models.move_to_end(model_name, last=False)  # First to be evicted
+            self._last_used[model_name] = time.monotonic()
+            self._enforce_budget()
+            if model_name in self.models:
+                self._start_warmup(model_name, session)
+            self._start_reaper()
             
-            # Update usage stats
+            if not prefetch:
+                self._record_use(model_name)
+        
+        return session
+
+    def _record_use(self, model_name):
+        """Update a model's usage stats in the registry"""
+        with self._lock:
             self.model_registry[model_name]['last_used'] = datetime.now().isoformat()
             self.model_registry[model_name]['use_count'] += 1
             self._save_registry()
-            
+
+    def load_model_async(self, model_name, prefetch=False):
+        """
+        Load a model on a background loader thread (see load_model).
+        Returns a Future of the session.
+        """
+        with self._lock:
+            if self._loader is None:
+                # Two workers, so a user's selection is not queued behind a prefetch
+                self._loader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="model-loader")
+        return self._loader.submit(self.load_model, model_name, prefetch)
+
+    def is_model_loading(self, model_name):
+        """True while a load of the model is in flight"""
+        return model_name in self._loading
+
+    def prefetch_next_model(self):
+        """
+        Start loading the most used model (by registry use_count) that is
+        not loaded yet, if it fits in the memory budget next to the loaded
+        sessions. Returns the load's Future, or None.
+        """
+        with self._lock:
+            busy = set(self.models) | set(self._loading) | {self.current_model_name}
+            candidates = [
+                name for name, info in self.model_registry.items()
+                if name not in busy and not info.get('composite')
+                and info.get('use_count', 0) > 0 and os.path.isfile(info['path'])
+            ]
+            if not candidates:
+                return None
+            name = max(candidates, key=lambda n: self.model_registry[n]['use_count'])
+            if self.loaded_bytes() + self._estimated_cost(name) > self.MEMORY_BUDGET_MB * 1024 * 1024:
+                return None
+        return self.load_model_async(name, prefetch=True)
+
+    def acquire_model(self, model_name):
+        """
+        Load a model and lease its session: until the matching
+        release_model(), budget and idle eviction skip it, so a long
+        evaluation and interactive classification can share the cache
+        without reloads. Returns the session.
+        
+        Composite stand-ins are returned without a lease; their services
+        lease the member sessions for each request instead.
+        """
+        while True:
+            session = self.load_model(model_name)
+            if self.is_composite(model_name):
+                return session
+            with self._lock:
+                # Another thread may have evicted it since load_model returned
+                if self.models.get(model_name) is session:
+                    self._leases[model_name] = self._leases.get(model_name, 0) + 1
+                    return session
+
+    def release_model(self, model_name):
+        """
+        End a lease from acquire_model. Evictions deferred while the session
+        was leased happen now.
+        """
+        with self._lock:
+            count = self._leases.get(model_name, 0)
+            if count <= 1:
+                self._leases.pop(model_name, None)
+            else:
+                self._leases[model_name] = count - 1
+            if model_name in self.models:
+                self._last_used[model_name] = time.monotonic()
+            self._enforce_budget()
+
+    @contextmanager
+    def lease_model(self, model_name):
+        """`with manager.lease_model(name) as session:` around acquire/release"""
+        session = self.acquire_model(model_name)
+        try:
+            yield session
+        finally:
+            self.release_model(model_name)
+
+    def is_model_leased(self, model_name):
+        """True while any caller holds a lease on the model's session"""
+        return model_name in self._leases
+
+    def _estimated_cost(self, model_name):
+        """Resident bytes of a model's session: measured, else file size plus arena"""
+        if model_name in self._costs:
+            return self._costs[model_name]
+        try:
+            size = os.path.getsize(self.model_registry[model_name]['path'])
+        except (KeyError, OSError):
+            return 0
+        return int(size * (1 + self.ARENA_FRACTION))
+
+    def loaded_bytes(self):
+        """Measured resident cost of all loaded sessions"""
+        with self._lock:
+            return sum(self._estimated_cost(name) for name in self.models)
+
+    def fits_in_budget(self, model_names):
+        """True if these models can be loaded at the same time"""
+        return sum(self._estimated_cost(name) for name in model_names) <= \
+            self.MEMORY_BUDGET_MB * 1024 * 1024
+
+    def _enforce_budget(self, incoming=0):
+        """
+        Evict least recently used sessions while the loaded ones plus
+        `incoming` bytes exceed the budget. The most recent session is
+        kept when nothing is incoming, so an oversized model still loads.
+        Leased sessions are skipped; the budget may be exceeded until
+        their release_model() evicts them.
+        """
+        budget = self.MEMORY_BUDGET_MB * 1024 * 1024
+        with self._lock:
+            victims = [name for name in self.models if name not in self._leases]
+            if not incoming and victims and victims[-1] == next(reversed(self.models)):
+                victims.pop()
+            for name in victims:
+                if self.loaded_bytes() + incoming <= budget:
+                    break
+                self._unload(name)
+
+    def release_idle_models(self):
+        """
+        Release sessions not used for IDLE_UNLOAD_SECONDS whose inference
+        service is idle too. Returns the released model names.
+        """
+        cutoff = time.monotonic() - self.IDLE_UNLOAD_SECONDS
+        with self._lock:
+            idle = [name for name, session in self.models.items()
+                    if self._last_used.get(name, 0) < cutoff and name not in self._leases
+                    and not getattr(getattr(session, '_service', None), 'busy', False)]
+            for name in idle:
+                self._unload(name)
+        return idle
+
+    def _start_reaper(self):
+        """Run release_idle_models periodically while sessions are loaded"""
+        if self._reaper is not None:
+            return
+        
+        def reap():
+            while True:
+                time.sleep(self.IDLE_CHECK_SECONDS)
+                self.release_idle_models()
+                with self._lock:
+                    if not self.models:
+                        self._reaper = None
+                        return
+        
+        self._reaper = threading.Thread(target=reap, daemon=True)
+        self._reaper.start()
+
+    def _require_file_model(self, model_name):
+        """Raise ValueError unless model_name is a registered ONNX file"""
+        if model_name not in self.model_registry:
+            raise ValueError(f"Model not registered: {model_name}")
+        if self.model_registry[model_name].get('composite'):
+            raise ValueError(f"Not supported for composite model: {model_name}")
+
+    def is_composite(self, model_name):
+        """True for registry entries built from other models (cascades, ensembles)"""
+        return bool(self.model_registry.get(model_name, {}).get('composite'))
+
+    def create_cascade(self, screener, expert, threshold=DEFAULT_CASCADE_THRESHOLD, name=None):
+        """
+        Register a cascade: `screener` classifies every image and `expert`
+        re-classifies those whose top probability is below `threshold`.
+        Both must take the same preprocessed input. Creating a cascade under
+        an existing name updates it. Returns the cascade's name.
+        """
+        if not 0.0 < float(threshold) <= 1.0:
+            raise ValueError("Threshold must be in (0, 1].")
+        self._check_members([screener, expert])
+        
+        name = name or f"cascade_{screener}_{expert}"
+        return self._register_composite(name, COMPOSITE_CASCADE, [screener, expert],
+                                        threshold=float(threshold))
+
+    def create_ensemble(self, members, method=ENSEMBLE_AVERAGE, name=None):
+        """
+        Register an ensemble: every member classifies the same preprocessed
+        tensor and their probabilities are averaged ('average') or voted
+        ('vote'). Members must take the same preprocessed input. Creating an
+        ensemble under an existing name updates it. Returns its name.
+        """
+        if method not in ENSEMBLE_METHODS:
+            raise ValueError(f"Unknown ensemble method: {method}")
+        members = list(members)
+        if len(members) < 2:
+            raise ValueError("An ensemble needs at least two models.")
+        self._check_members(members)
+        
+        name = name or "ensemble_" + "_".join(members)
+        return self._register_composite(name, COMPOSITE_ENSEMBLE, members, method=method)
+
+    def _check_members(self, members):
+        """Validate the members of a new composite model"""
+        for member in members:
+            self._require_file_model(member)
+        if len(set(members)) != len(members):
+            raise ValueError("Composite members must be different models.")
+        
+        # Members share one preprocessed tensor, so their specs must match.
+        # Loaded one at a time, so this stays within the memory budget.
+        specs = [self.load_model(member)._preprocess_transform.spec for member in members]
+        if any(spec != specs[0] for spec in specs[1:]):
+            raise ValueError("Composite members must use the same preprocessing.")
+
+    def _register_composite(self, name, kind, members, **params):
+        """Write a composite's registry entry, keeping its usage stats"""
+        with self._lock:
+            if name in self.model_registry and not self.is_composite(name):
+                raise ValueError(f"Name already used by a model file: {name}")
+            previous = self.model_registry.get(name, {})
+            self.model_registry[name] = dict(
+                {'name': name, 'composite': kind, 'members': list(members)},
+                **params,
+                registered_at=previous.get('registered_at', datetime.now().isoformat()),
+                last_used=previous.get('last_used'),
+                use_count=previous.get('use_count', 0)
+            )
+            self.composites.pop(name, None)
+            self._save_registry()
+        return name
+
+    def _load_composite(self, model_name):
+        """Return the stand-in for a composite model, loading its members"""
+        info = self.model_registry[model_name]
+        for member in info['members']:
+            if member not in self.model_registry:
+                raise ValueError(f"Member model not registered: {member}")
+        
+        with self._lock:
+            composite = self.composites.get(model_name)
+            if composite is None:
+                if info['composite'] == COMPOSITE_ENSEMBLE:
+                    composite = EnsembleModel(self, model_name, info['members'], info['method'])
+                else:
+                    screener, expert = info['members']
+                    composite = CascadeModel(self, model_name, screener, expert, info['threshold'])
+                self.composites[model_name] = composite
+                
+                # Update usage stats
+                info['last_used'] = datetime.now().isoformat()
+                info['use_count'] += 1
+                self._save_registry()
+        
+        composite.load()
+        return composite
+
+    def _start_warmup(self, model_name, session):
+        """
+        Run one synthetic inference in the background so the user's first
+        request does not pay for lazy allocation and kernel setup.
+        """
+        engine = get_engine(session)
+        transform = session._preprocess_transform
+        sample = np.zeros((1,) + transform.sample_shape, dtype=transform.dtype)
+        run_options = onnxruntime.RunOptions()
+        self._warmups[model_name] = run_options
+        
+        def warm():
+            rss_before = process_rss()
+            try:
+                ready = engine.warm_up(sample, run_options)
+            except Exception:
+                ready = False  # A real request will surface the error
+            finally:
+                with self._lock:
+                    if self._warmups.get(model_name) is run_options:
+                        del self._warmups[model_name]
+            rss_after = process_rss()
+            if ready and rss_before is not None and rss_after is not None:
+                # The first run's arena allocations belong to the session
+                with self._lock:
+                    if self.models.get(model_name) is session:
+                        self._costs[model_name] += max(0, rss_after - rss_before)
+                        self._enforce_budget()
+            if ready and self.ready_callback is not None:
+                self.ready_callback(model_name)
+        
+        def run():
+            try:
+                warm()
+            finally:
+                with self._lock:
+                    self._warmup_threads.discard(thread)
+        
+        thread = threading.Thread(target=run, daemon=True)
+        with self._lock:
+            self._warmup_threads.add(thread)
+        thread.start()
+
+    def _cancel_warmup(self, model_name):
+        """Abort a pending or running warm-up of a model"""
+        with self._lock:
+            run_options = self._warmups.pop(model_name, None)
+        if run_options is not None:
+            run_options.terminate = True
+
+    def close(self):
+        """
+        Stop background work before exit: terminate running warm-ups and
+        wait for them, and drop queued background loads. Safe to call
+        more than once; also runs at interpreter exit.
+        """
+        self.ready_callback = None  # The UI may already be gone
+        with self._lock:
+            for model_name in list(self._warmups):
+                self._cancel_warmup(model_name)
+            threads = list(self._warmup_threads)
+            loader, self._loader = self._loader, None
+        if loader is not None:
+            loader.shutdown(wait=False, cancel_futures=True)
+        for thread in threads:
+            thread.join()
+
+    def _unload(self, model_name):
+        """
+        Drop a loaded session, cancelling its warm-up. Explicit unloads
+        (removal, re-tuning) also drop leased sessions from the cache;
+        lease holders keep using the session object they were given.
+        """
+        with self._lock:
+            self._cancel_warmup(model_name)
+            session = self.models.pop(model_name, None)
+            self._last_used.pop(model_name, None)
+        if session is not None:
+            stop_service(session)
+
+    def is_model_ready(self, model_name):
+        """
+        True when the model is loaded and has completed a run; for a
+        composite, when its resident members are.
+        """
+        composite = self.composites.get(model_name)
+        if composite is not None:
+            return all(self.is_model_ready(member) for member in composite.resident_members())
+        session = self.models.get(model_name)
+        return session is not None and get_engine(session).ready.is_set()
+
+    def get_session_profile(self, model_name, purpose=PURPOSE_LATENCY):
+        """
+        Return the SessionOptions profile tuned for this machine and purpose
+        ('latency' or 'throughput'), or None for ORT defaults.
+        """
+        tuned = self.model_registry.get(model_name, {}).get('session_profiles', {})
+        entry = tuned.get(machine_key(), {}).get(purpose)
+        return entry['profile'] if entry else None
+
+    def autotune_model(self, model_name, batch_size=8, progress=None):
+        """
+        Benchmark SessionOptions candidates for a model on this machine and
+        record the latency and throughput winners in the registry. A loaded
+        session is dropped so the next load applies the new profile.
+        """
+        self._require_file_model(model_name)
+        
+        model_path = self.model_registry[model_name]['path']
+        result = autotune(model_path, batch_size=batch_size, progress=progress)
+        
+        with self._lock:
+            profiles = self.model_registry[model_name].setdefault('session_profiles', {})
+            profiles[result['machine']] = result
+            self._save_registry()
+        
+        self._unload(model_name)
+        return result
+
+    def profile_model(self, model_name, runs=20, batch_size=1):
+        """
+        Profile a model per operator with its tuned session profile (see
+        SessionProfiles.profile_operators) and keep the report in the
+        registry, per machine. Returns the report.
+        """
+        self._require_file_model(model_name)
+        
+        model_path = self.model_registry[model_name]['path']
+        report = profile_operators(model_path, self.get_session_profile(model_name),
+                                   runs=runs, batch_size=batch_size)
+        
+        with self._lock:
+            reports = self.model_registry[model_name].setdefault('operator_profiles', {})
+            reports[report['machine']] = report
+            self._save_registry()
+        return report
+
+    def get_operator_profile(self, model_name):
+        """Return this machine's stored operator profile of a model, or None"""
+        reports = self.model_registry.get(model_name, {}).get('operator_profiles', {})
+        return reports.get(machine_key())
+
+    def _optimized_model_path(self, model_name, profile):
+        """Artifact path keyed by model hash, ORT version, machine and profile"""
+        info = self.model_registry[model_name]
+        key = hashlib.sha256("|".join([
+            info.get('hash', ''), onnxruntime.__version__, machine_key(), profile_key(profile)
+        ]).encode()).hexdigest()[:16]
+        return os.path.join(self.OPTIMIZED_DIR, f"{model_name}-{key}.onnx")
+
+    def _remove_optimized_models(self, model_name, keep=None):
+        """Delete cached artifacts of a model, except `keep`"""
+        if not os.path.isdir(self.OPTIMIZED_DIR):
+            return
+        pattern = re.compile(re.escape(model_name) + r"-[0-9a-f]{16}\.onnx")
+        for fname in os.listdir(self.OPTIMIZED_DIR):
+            path = os.path.join(self.OPTIMIZED_DIR, fname)
+            if pattern.fullmatch(fname) and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _create_session(self, model_name, model_path):
+        """
+        Create a session with the model's tuned profile.
+        
+        The first load saves the optimized graph via optimized_model_filepath;
+        later loads read that artifact with graph optimization disabled, so
+        the optimizer does not run again on every model switch.
+        """
+        profile = self.get_session_profile(model_name)
+        artifact = self._optimized_model_path(model_name, profile)
+        
+        if self._artifact_is_current(artifact, model_path):
+            options = make_session_options(dict(profile or {}, graph_optimization_level='disabled'))
+            try:
+                return onnxruntime.InferenceSession(artifact, sess_options=options)
+            except Exception:
+                pass  # Unreadable artifact: rebuild it below
+        
+        options = make_session_options(profile)
+        tmp_path = artifact[:-len(".onnx")] + ".tmp.onnx"
+        try:
+            os.makedirs(self.OPTIMIZED_DIR, exist_ok=True)
+            options.optimized_model_filepath = tmp_path
+            session = onnxruntime.InferenceSession(model_path, sess_options=options)
+            os.replace(tmp_path, artifact)
+            self._remove_optimized_models(model_name, keep=artifact)
             return session
-        except Exception as e:
-            raise RuntimeError(f"Failed to load model {model_name}: {str(e)}")
+        except Exception:
+            # e.g. models over 2 GB cannot be serialized; load without caching
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return onnxruntime.InferenceSession(model_path, sess_options=make_session_options(profile))
+
+    @staticmethod
+    def _artifact_is_current(artifact, model_path):
+        """True if a cached optimized graph exists and postdates the model"""
+        return os.path.isfile(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(model_path)
+
+    def create_replica_pool(self, model_name, replicas=None):
+        """
+        Create a ReplicaPool of single-threaded sessions of a model for
+        throughput-oriented evaluation; the caller closes it when done.
+        
+        replicas defaults to plan_replicas() for this machine's cores and
+        available memory. Replicas read the model's cached optimized graph
+        when there is one, so they skip the optimizer and share its fused
+        weights.
+        """
+        self._require_file_model(model_name)
+        self.load_model(model_name)  # Also builds the optimized-graph cache
+        
+        model_path = self.model_registry[model_name]['path']
+        profile = dict(self.get_session_profile(model_name, PURPOSE_THROUGHPUT) or {})
+        artifact = self._optimized_model_path(model_name, self.get_session_profile(model_name))
+        if self._artifact_is_current(artifact, model_path):
+            model_path = artifact
+            profile['graph_optimization_level'] = 'disabled'
+        
+        planned, prepack = plan_replicas(os.path.getsize(model_path))
+        return ReplicaPool(model_path, replicas or planned, profile, prepack=prepack)
+
+    def _compile_transform(self, model_name, session):
+        """Attach the compiled preprocessing, honouring registry stages"""
+        stages = self.model_registry[model_name].get('preprocess_stages')
+        session._preprocess_transform = compile_transform(spec_from_session(session, stages))
+
+    def set_preprocess_stages(self, model_name, stages):
+        """
+        Select optional preprocessing stages (CLAHE, histogram matching) for
+        a model; None falls back to the model's own metadata.
+        """
+        self._require_file_model(model_name)
+        
+        parse_stages(stages)  # Validate before persisting
+        with self._lock:
+            if stages is None:
+                self.model_registry[model_name].pop('preprocess_stages', None)
+            else:
+                self.model_registry[model_name]['preprocess_stages'] = list(stages)
+            self._save_registry()
+            
+            if model_name in self.models:
+                self._compile_transform(model_name, self.models[model_name])
 
     def ensure_model_loaded(self, model_name):
         """Ensure model is loaded, loading if necessary"""
@@ -137,11 +1046,15 @@ class ModelManager:
 
     def get_model_names(self):
         """Return list of registered model names"""
-        return list(self.model_registry.keys())
+        with self._lock:
+            return list(self.model_registry.keys())
 
     def set_current_model(self, model_name):
         """Set the active model"""
         if model_name in self.model_registry:
+            # Switching away: the old model's warm-up is no longer worth it
+            if self.current_model_name and self.current_model_name != model_name:
+                self._cancel_warmup(self.current_model_name)
             self.current_model_name = model_name
 
     def get_current_model(self):
@@ -156,14 +1069,24 @@ class ModelManager:
 
     def remove_model(self, model_name):
         """Remove a model from registry (file remains)"""
+        # Composites built on this model go with it
+        with self._lock:
+            dependents = [name for name, info in self.model_registry.items()
+                          if model_name in info.get('members', ())]
+        for name in dependents:
+            self.remove_model(name)
+        
         # Remove from loaded models
-        if model_name in self.models:
-            del self.models[model_name]
+        self._unload(model_name)
+        self.composites.pop(model_name, None)
+        
+        self._remove_optimized_models(model_name)
         
         # Remove from registry
-        if model_name in self.model_registry:
-            del self.model_registry[model_name]
-            self._save_registry()
+        with self._lock:
+            if model_name in self.model_registry:
+                del self.model_registry[model_name]
+                self._save_registry()
         
         # Clear current if it was removed
         if self.current_model_name == model_name:
@@ -176,11 +1099,15 @@ class ModelManager:
     def cleanup_orphaned_models(self):
         """Remove registry entries for models whose files no longer exist"""
         orphaned = []
-        for name, info in self.model_registry.items():
-            if not os.path.isfile(info['path']):
-                orphaned.append(name)
+        with self._lock:
+            for name, info in self.model_registry.items():
+                if info.get('composite'):
+                    continue  # Removed along with a missing member
+                if not os.path.isfile(info['path']):
+                    orphaned.append(name)
         
         for name in orphaned:
-            self.remove_model(name)
+            if name in self.model_registry:
+                self.remove_model(name)
         
         return orphaned
\ No newline at end of file
@@ -0,0 +1,404 @@
+# backend/ModelOptimization.py
+
+import os
+import tempfile
+
+import numpy as np
+
+# Metadata keys written into derived models and read back by Inference
+META_INPUT_FORMAT = 'input_format'
+META_OUTPUT_PROBABILITIES = 'output_is_probabilities'
+INPUT_FORMAT_UINT8_NHWC = 'uint8_nhwc'
+
+# Optional metadata_props describing how a model expects its input
+META_MEAN = 'mean'                    # "0.485,0.456,0.406" or JSON list
+META_STD = 'std'
+META_CHANNEL_ORDER = 'channel_order'  # "BGR" or "RGB"
+META_INPUT_SIZE = 'input_size'        # "224" or "224,224" (width,height)
+META_STAGES = 'preprocess_stages'     # JSON list, see ImagePreprocessing.parse_stages
+META_WINDOW_CENTER = 'window_center'  # 16-bit window/level; auto min..max if absent
+META_WINDOW_WIDTH = 'window_width'
+META_QUANTIZATION = 'quantization'     # 'dynamic' or 'static' on INT8 variants
+
+QUANTIZATION_DYNAMIC = 'dynamic'  # INT8 weights, activations quantized per run
+QUANTIZATION_STATIC = 'static'    # QDQ with calibrated activation ranges
+
+
+def parse_float_list(value):
+    """Parse "a,b,c" or "[a, b, c]" into a tuple of floats; None if invalid."""
+    if not value:
+        return None
+    try:
+        items = value.strip().strip('[]()').split(',')
+        return tuple(float(v) for v in items if v.strip())
+    except ValueError:
+        return None
+
+
+def _require_onnx():
+    """Import the onnx package lazily; it is only needed for graph rewrites."""
+    try:
+        import onnx
+        return onnx
+    except ImportError:
+        raise RuntimeError("The 'onnx' package is required to rewrite models.")
+
+
+def _require_quantization():
+    """Import onnxruntime.quantization lazily; it pulls in onnx and sympy."""
+    try:
+        from onnxruntime import quantization
+        return quantization
+    except ImportError:
+        raise RuntimeError("onnxruntime.quantization (with 'onnx') is required to quantize models.")
+
+
+def _set_metadata(model, key, value):
+    for prop in model.metadata_props:
+        if prop.key == key:
+            prop.value = value
+            return
+    entry = model.metadata_props.add()
+    entry.key = key
+    entry.value = value
+
+
+def _unique_name(graph, base):
+    """Return a tensor/node name not yet used anywhere in the graph."""
+    used = {i.name for i in graph.input} | {o.name for o in graph.output}
+    used |= {init.name for init in graph.initializer}
+    for node in graph.node:
+        used.update(node.input)
+        used.update(node.output)
+        used.add(node.name)
+    name, k = base, 0
+    while name in used:
+        k += 1
+        name = f"{base}_{k}"
+    return name
+
+
+def fold_preprocessing(src_path, dst_path, mean, std):
+    """
+    Write a derived model that takes raw resized pixels and returns
+    probabilities.
+
+    The float32 NCHW input is replaced by a uint8 NHWC input followed by
+    Cast -> Transpose -> Mul(1 / (255 * std)) -> Add(-mean / std), and a
+    Softmax over the last axis is appended to the first output unless the
+    graph already ends in one. Both facts are recorded in metadata_props.
+
+    Parameters
+    ----------
+    src_path, dst_path : str
+        Source ONNX model and destination for the derived model.
+    mean, std : sequence of float
+        Per-channel statistics the original model was trained with; the
+        model's own 'mean'/'std' metadata_props take precedence.
+
+    Returns
+    -------
+    str
+        dst_path.
+
+    Raises
+    ------
+    RuntimeError if onnx is missing; ValueError if the graph does not
+    take a single float 4-D NCHW input.
+    """
+    onnx = _require_onnx()
+    from onnx import TensorProto, helper, numpy_helper
+
+    model = onnx.load(src_path)
+    graph = model.graph
+
+    props = {p.key: p.value for p in model.metadata_props}
+    mean = parse_float_list(props.get(META_MEAN)) or mean
+    std = parse_float_list(props.get(META_STD)) or std
+
+    initializer_names = {init.name for init in graph.initializer}
+    inputs = [i for i in graph.input if i.name not in initializer_names]
+    if len(inputs) != 1:
+        raise ValueError("Model must have exactly one image input.")
+    original = inputs[0]
+    tensor_type = original.type.tensor_type
+    if tensor_type.elem_type != TensorProto.FLOAT or len(tensor_type.shape.dim) != 4:
+        raise ValueError("Model input must be a float32 NCHW tensor.")
+
+    # (N, C, H, W) dims copied into an (N, H, W, C) uint8 input
+    dims = list(tensor_type.shape.dim)
+    channels = dims[1].dim_value if dims[1].HasField('dim_value') else len(mean)
+    if channels != len(mean):
+        mean = [float(np.mean(mean))] * channels
+        std = [float(np.mean(std))] * channels
+
+    def dim_value(d):
+        if d.HasField('dim_value'):
+            return d.dim_value
+        return d.dim_param or None
+
+    raw_name = _unique_name(graph, 'image_uint8')
+    raw_input = helper.make_tensor_value_info(
+        raw_name, TensorProto.UINT8,
+        [dim_value(dims[0]), dim_value(dims[2]), dim_value(dims[3]), channels]
+    )
+
+    mean = np.asarray(mean, dtype=np.float32).reshape(1, channels, 1, 1)
+    std = np.asarray(std, dtype=np.float32).reshape(1, channels, 1, 1)
+    scale_name = _unique_name(graph, 'preprocess_scale')
+    offset_name = _unique_name(graph, 'preprocess_offset')
+    graph.initializer.extend([
+        numpy_helper.from_array((1.0 / (255.0 * std)).astype(np.float32), scale_name),
+        numpy_helper.from_array((-mean / std).astype(np.float32), offset_name),
+    ])
+
+    cast_out = _unique_name(graph, 'preprocess_cast')
+    nchw_out = _unique_name(graph, 'preprocess_nchw')
+    scaled_out = _unique_name(graph, 'preprocess_scaled')
+    prologue = [
+        helper.make_node('Cast', [raw_name], [cast_out], to=TensorProto.FLOAT,
+                         name=_unique_name(graph, 'PreprocessCast')),
+        helper.make_node('Transpose', [cast_out], [nchw_out], perm=[0, 3, 1, 2],
+                         name=_unique_name(graph, 'PreprocessTranspose')),
+        helper.make_node('Mul', [nchw_out, scale_name], [scaled_out],
+                         name=_unique_name(graph, 'PreprocessScale')),
+        # Writes the original input name so existing consumers are untouched
+        helper.make_node('Add', [scaled_out, offset_name], [original.name],
+                         name=_unique_name(graph, 'PreprocessOffset')),
+    ]
+
+    graph.input.remove(original)
+    graph.input.insert(0, raw_input)
+    nodes = prologue + list(graph.node)
+
+    # Append Softmax to the first output unless it is already produced by one
+    output = graph.output[0]
+    producer = next((n for n in graph.node if output.name in n.output), None)
+    if producer is None or producer.op_type != 'Softmax':
+        logits_name = _unique_name(graph, f"{output.name}_logits")
+        for node in nodes:
+            for k, name in enumerate(node.output):
+                if name == output.name:
+                    node.output[k] = logits_name
+            for k, name in enumerate(node.input):
+                if name == output.name:
+                    node.input[k] = logits_name
+        nodes.append(helper.make_node('Softmax', [logits_name], [output.name], axis=-1,
+                                      name=_unique_name(graph, 'OutputSoftmax')))
+
+    del graph.node[:]
+    graph.node.extend(nodes)
+
+    _set_metadata(model, META_INPUT_FORMAT, INPUT_FORMAT_UINT8_NHWC)
+    _set_metadata(model, META_OUTPUT_PROBABILITIES, '1')
+
+    onnx.checker.check_model(model)
+    onnx.save(model, dst_path)
+    return dst_path
+
+
+def quantize_model(src_path, dst_path, mode=QUANTIZATION_DYNAMIC, calibration_inputs=None):
+    """
+    Write an INT8 variant of a model.
+
+    Parameters
+    ----------
+    src_path, dst_path : str
+        Source ONNX model and destination for the quantized model.
+    mode : str
+        QUANTIZATION_DYNAMIC quantizes weights only and needs no data.
+        QUANTIZATION_STATIC writes QDQ (uint8 activations, int8 per-channel
+        weights) with activation ranges calibrated on calibration_inputs.
+    calibration_inputs : iterable of numpy.ndarray, optional
+        Preprocessed input tensors, one batch per item; required for static.
+
+    Returns
+    -------
+    str
+        dst_path.
+
+    Raises
+    ------
+    RuntimeError if the quantization tooling is missing; ValueError for an
+    unknown mode or static quantization without calibration data.
+    """
+    if mode not in (QUANTIZATION_DYNAMIC, QUANTIZATION_STATIC):
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    if mode == QUANTIZATION_STATIC and calibration_inputs is None:
+        raise ValueError("Static quantization needs a calibration dataset.")
+
+    onnx = _require_onnx()
+    quant = _require_quantization()
+
+    source = onnx.load(src_path)
+    initializer_names = {init.name for init in source.graph.initializer}
+    input_name = next(i.name for i in source.graph.input if i.name not in initializer_names)
+
+    class _CalibrationReader(quant.CalibrationDataReader):
+        def __init__(self, tensors):
+            self._tensors = iter(tensors)
+
+        def get_next(self):
+            tensor = next(self._tensors, None)
+            return None if tensor is None else {input_name: tensor}
+
+    fd, prepared = tempfile.mkstemp(suffix='.onnx')
+    os.close(fd)
+    try:
+        # Shape inference and graph cleanup the quantizer works best on
+        try:
+            quant.shape_inference.quant_pre_process(src_path, prepared)
+        except Exception:
+            onnx.save(source, prepared)
+
+        if mode == QUANTIZATION_DYNAMIC:
+            # uint8 weights: ConvInteger kernels on older ARM builds need them
+            quant.quantize_dynamic(prepared, dst_path, weight_type=quant.QuantType.QUInt8)
+        else:
+            quant.quantize_static(
+                prepared, dst_path, _CalibrationReader(calibration_inputs),
+                quant_format=quant.QuantFormat.QDQ,
+                activation_type=quant.QuantType.QUInt8,
+                weight_type=quant.QuantType.QInt8,
+                per_channel=True
+            )
+    finally:
+        os.remove(prepared)
+
+    # Keep the source's preprocessing metadata and record the mode
+    model = onnx.load(dst_path)
+    for prop in source.metadata_props:
+        _set_metadata(model, prop.key, prop.value)
+    _set_metadata(model, META_QUANTIZATION, mode)
+    onnx.save(model, dst_path)
+    return dst_path
+
+
+def _fixed_batch(value_info):
+    """Fixed size of a tensor's first axis, None if symbolic, 0 if scalar."""
+    dims = value_info.type.tensor_type.shape.dim
+    if not dims:
+        return 0
+    return dims[0].dim_value if dims[0].HasField('dim_value') else None
+
+
+def make_batch_dynamic(src_path, dst_path, dim_param='batch'):
+    """
+    Write a copy of a fixed-batch model whose batch axis is symbolic.
+
+    The first axis of the input and of every output becomes `dim_param`,
+    Reshape targets that hard-code the batch size get 0 there (copy the
+    input's size), and intermediate shape hints are dropped so they are
+    re-inferred. Other batch-dependent constants are left alone, so check
+    the result with validate_dynamic_batch().
+
+    Returns
+    -------
+    int or None
+        The fixed batch size that was replaced, or None (nothing written)
+        if the batch axis is already symbolic.
+
+    Raises
+    ------
+    RuntimeError if onnx is missing; ValueError if the graph does not have
+    a single input whose batch axis all outputs share.
+    """
+    onnx = _require_onnx()
+    from onnx import numpy_helper
+
+    model = onnx.load(src_path)
+    graph = model.graph
+
+    initializer_names = {init.name for init in graph.initializer}
+    inputs = [i for i in graph.input if i.name not in initializer_names]
+    if len(inputs) != 1:
+        raise ValueError("Model must have exactly one image input.")
+    batch = _fixed_batch(inputs[0])
+    if batch is None:
+        return None
+    if batch == 0:
+        raise ValueError("Model input has no batch axis.")
+    if any(_fixed_batch(output) != batch for output in graph.output):
+        raise ValueError("Model outputs do not share the input's batch axis.")
+
+    for value in [inputs[0]] + list(graph.output):
+        value.type.tensor_type.shape.dim[0].dim_param = dim_param
+    del graph.value_info[:]
+
+    shape_tensors = {init.name: init for init in graph.initializer}
+    for node in graph.node:
+        if node.op_type == 'Constant':
+            for attr in node.attribute:
+                if attr.name == 'value':
+                    shape_tensors[node.output[0]] = attr.t
+
+    for node in graph.node:
+        if node.op_type != 'Reshape' or len(node.input) < 2:
+            continue
+        if any(attr.name == 'allowzero' and attr.i for attr in node.attribute):
+            continue  # 0 would mean an empty axis, not "copy"
+        tensor = shape_tensors.get(node.input[1])
+        if tensor is None:
+            continue  # Computed at runtime, e.g. from Shape
+        shape = numpy_helper.to_array(tensor)
+        if shape.ndim != 1 or not len(shape) or shape[0] != batch:
+            continue
+        shape = shape.copy()
+        shape[0] = 0
+        name = _unique_name(graph, f"{node.input[1]}_dynamic_batch")
+        graph.initializer.append(numpy_helper.from_array(shape, name))
+        node.input[1] = name
+
+    onnx.checker.check_model(model)
+    onnx.save(model, dst_path)
+    return batch
+
+
+def validate_dynamic_batch(src_path, dst_path, batch, fill_dim=224, seed=0,
+                           rtol=1e-3, atol=1e-4):
+    """
+    Check a make_batch_dynamic() result on random inputs: the variant must
+    match the original on the original's batch size, and a batched run
+    must match running the same images one at a time.
+
+    Symbolic non-batch input axes are set to `fill_dim`.
+
+    Raises
+    ------
+    ValueError if the outputs differ or the variant cannot run batched.
+    """
+    import onnxruntime
+
+    original = onnxruntime.InferenceSession(src_path)
+    variant = onnxruntime.InferenceSession(dst_path)
+    model_input = original.get_inputs()[0]
+    dims = [d if isinstance(d, int) and d > 0 else fill_dim for d in model_input.shape[1:]]
+
+    rng = np.random.default_rng(seed)
+    count = 2 * batch + 1  # Not a multiple of the old batch size
+    if model_input.type == 'tensor(uint8)':
+        x = rng.integers(0, 256, size=[count] + dims, dtype=np.uint8)
+    elif model_input.type == 'tensor(float)':
+        x = rng.standard_normal([count] + dims).astype(np.float32)
+    else:
+        raise ValueError(f"Unsupported input type: {model_input.type}")
+
+    def run(session, data):
+        return session.run(None, {session.get_inputs()[0].name: data})
+
+    try:
+        batched = run(variant, x)
+        references = [
+            [np.concatenate(parts) for parts in zip(*(run(original, x[i:i + batch])
+                                                      for i in range(0, 2 * batch, batch)))],
+            [np.concatenate(parts) for parts in zip(*(run(variant, x[i:i + 1])
+                                                      for i in range(count)))],
+        ]
+        for reference in references:
+            for expected, actual in zip(reference, batched):
+                if not np.allclose(expected, actual[:len(expected)], rtol=rtol, atol=atol):
+                    raise ValueError("Batched outputs differ from the original model.")
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Model cannot run with a dynamic batch: {e}")
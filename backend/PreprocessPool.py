@@ -0,0 +1,168 @@
+# backend/PreprocessPool.py
+
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .ImagePreprocessing import compile_transform
+
+
+_main_lock = threading.Lock()
+
+
+def default_workers():
+    """One worker per core, leaving one core for ONNX Runtime."""
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def _worker(shm_name, shape, dtype, spec, backend, tasks, free_slots, results):
+    """Preprocess paths from `tasks` into free ring slots; report slot indices."""
+    # Spawned children share the parent's resource tracker, which unlinks
+    # the segment once the parent does; workers only attach.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    transform = compile_transform(spec)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            label, path = task
+            slot = free_slots.get()
+            timings = []
+            try:
+                transform([path], out=ring[slot:slot + 1], timings=timings, backend=backend)
+                results.put((label, path, slot, None, timings))
+            except Exception as e:
+                free_slots.put(slot)
+                results.put((label, path, None, str(e), timings))
+    finally:
+        del ring
+        shm.close()
+
+
+@contextmanager
+def _worker_main():
+    """
+    Make this module the __main__ that spawned children re-import.
+
+    spawn runs the parent's main module in every child before the target;
+    for the GUI that is app_ui.py, which pulls in Tk and ONNX Runtime. The
+    workers only need this module, so while processes start the preparation
+    data names it instead.
+    """
+    with _main_lock:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = sys.modules[__name__]
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main
+
+
+class PreprocessPool:
+    """
+    Preprocess images in worker processes into a shared-memory ring buffer.
+
+    Workers write finished tensors straight into ring slots and send back
+    only the slot index, so no tensor is ever pickled. Use as a context
+    manager:
+
+        with PreprocessPool(transform.spec, backend, workers=3) as pool:
+            for label, path, tensor, error, timings in pool.imap(items):
+                ...  # tensor is valid until the next iteration
+    """
+
+    def __init__(self, spec, backend, workers=None, slots=None):
+        self.spec = spec
+        self.backend = backend
+        self.workers = workers or default_workers()
+        # Each worker may hold one slot while the consumer holds another
+        self.slots = slots or 2 * self.workers + 2
+        self._shm = None
+        self._processes = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        transform = compile_transform(self.spec)
+        shape = (self.slots,) + transform.sample_shape
+        dtype = np.dtype(transform.dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+
+        # spawn: the parent may already run ONNX Runtime / Tk threads
+        ctx = mp.get_context('spawn')
+        self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._ring = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf)
+        self._tasks = ctx.Queue()
+        self._free = ctx.Queue()
+        self._results = ctx.Queue()
+        for slot in range(self.slots):
+            self._free.put(slot)
+
+        with _worker_main():
+            for _ in range(self.workers):
+                p = ctx.Process(
+                    target=_worker,
+                    args=(self._shm.name, shape, dtype.str, self.spec, self.backend,
+                          self._tasks, self._free, self._results),
+                    daemon=True
+                )
+                p.start()
+                self._processes.append(p)
+
+    def imap(self, items):
+        """
+        Yield (label, path, tensor, error, timings) for every (label, path)
+        in items, in completion order. tensor is a (1, ...) view into the
+        ring (None on failure) and is recycled on the next iteration.
+        """
+        items = list(items)
+        for item in items:
+            self._tasks.put(item)
+        for _ in self._processes:
+            self._tasks.put(None)
+
+        held = None
+        remaining = len(items)
+        while remaining:
+            try:
+                label, path, slot, error, timings = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if any(p.exitcode not in (None, 0) for p in self._processes):
+                    raise RuntimeError("A preprocessing worker exited unexpectedly.")
+                continue
+            if held is not None:
+                self._free.put(held)
+                held = None
+            remaining -= 1
+            if slot is None:
+                yield label, path, None, error, timings
+            else:
+                held = slot
+                yield label, path, self._ring[slot:slot + 1], None, timings
+        if held is not None:
+            self._free.put(held)
+
+    def close(self):
+        for p in self._processes:
+            p.join(timeout=2.0)
+            if p.is_alive():
+                p.terminate()
+        self._processes = []
+        if self._shm is not None:
+            self._ring = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -0,0 +1,154 @@
+# backend/ReplicaPool.py
+
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import onnxruntime
+
+from .Inference import get_engine
+from .SessionProfiles import available_memory, make_session_options
+
+# Share of currently available memory the replicas may use
+MEMORY_FRACTION = 0.5
+# Rough private memory of a replica that shares unpacked weights
+# (activation arena and kernel scratch), as a fraction of the model size
+LEAN_REPLICA_FRACTION = 0.125
+
+_STOP = object()
+
+
+def plan_replicas(model_bytes, cores=None, memory=None):
+    """
+    Choose how many single-threaded replicas of a model to run.
+
+    One replica per core, limited by memory. Each replica normally keeps a
+    private copy of its prepacked weights (about one model size); if that
+    does not fit for every core, replicas skip prepacking and all read the
+    shared weights directly, which is slower per run but nearly free.
+
+    Returns (replicas, prepack).
+    """
+    cores = cores or os.cpu_count() or 1
+    memory = available_memory() if memory is None else memory
+    if memory is None:
+        return cores, True
+
+    model_bytes = max(1, int(model_bytes))
+    budget = memory * MEMORY_FRACTION - model_bytes  # Shared weights, once
+    if budget // model_bytes >= cores:
+        return cores, True
+    lean = int(budget // (model_bytes * LEAN_REPLICA_FRACTION))
+    if lean <= 1:
+        return 1, True
+    return min(cores, lean), False
+
+
+def load_shared_initializers(model_path):
+    """
+    Read a model's weights once as OrtValues that several sessions reference
+    through SessionOptions.add_initializer instead of each loading a copy.
+
+    Returns (arrays, values): `arrays` owns the memory and must outlive the
+    sessions. Returns ({}, {}) when the optional 'onnx' package is missing;
+    replicas then load their own weights.
+    """
+    try:
+        import onnx
+        from onnx import numpy_helper
+    except ImportError:
+        return {}, {}
+
+    model = onnx.load(model_path)
+    arrays = {init.name: np.ascontiguousarray(numpy_helper.to_array(init))
+              for init in model.graph.initializer}
+    values = {name: onnxruntime.OrtValue.ortvalue_from_numpy(array)
+              for name, array in arrays.items()}
+    return arrays, values
+
+
+class ReplicaPool:
+    """
+    Several sessions of one model fed from a shared queue, one worker
+    thread each, for throughput-oriented batch evaluation.
+
+    On CPU, N single-threaded sessions working on separate batches usually
+    beat one N-threaded session, which spends much of each run in thread
+    synchronisation. The weights are loaded once and shared by all
+    replicas.
+
+    It offers the same submit/predict interface as InferenceService, and
+    `concurrency` tells callers how many requests to keep in flight. Use
+    as a context manager, or call close().
+    """
+
+    def __init__(self, model_path, replicas, profile=None, prepack=True):
+        profile = dict(profile or {}, intra_op_num_threads=1, inter_op_num_threads=1,
+                       execution_mode='sequential')
+        # ORT does not copy added initializers; keep them alive with the pool
+        self._arrays, self._values = load_shared_initializers(model_path)
+        self.engines = []
+        for _ in range(max(1, int(replicas))):
+            options = make_session_options(profile)
+            for name, value in self._values.items():
+                options.add_initializer(name, value)
+            if not prepack:
+                # Prepacked copies are per session; the shared container
+                # that would dedupe them is not exposed to Python
+                options.add_session_config_entry('session.disable_prepacking', '1')
+            session = onnxruntime.InferenceSession(model_path, sess_options=options)
+            session._model_path = model_path
+            self.engines.append(get_engine(session))
+
+        self.concurrency = len(self.engines)
+        self.stats = {'requests': 0}
+        self._queue = queue.Queue()
+        self._threads = [threading.Thread(target=self._serve, args=(engine,), daemon=True)
+                         for engine in self.engines]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, tensor):
+        """Queue a (n, ...) input; returns a Future of (n, num_classes)."""
+        future = Future()
+        self._queue.put((tensor, future))
+        return future
+
+    def predict(self, tensor, timeout=None):
+        """Submit and wait for the result."""
+        return self.submit(tensor).result(timeout)
+
+    def close(self):
+        """Finish queued work, then release the replicas."""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.engines = []
+        self._values = {}
+        self._arrays = {}
+
+    stop = close
+
+    def _serve(self, engine):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            tensor, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.stats['requests'] += 1
+            try:
+                future.set_result(engine.predict(tensor))
+            except Exception as e:
+                future.set_exception(e)
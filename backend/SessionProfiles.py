@@ -0,0 +1,336 @@
+# backend/SessionProfiles.py
+
+import gc
+import json
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+import onnxruntime
+
+from .ImagePreprocessing import INPUT_SIZE, machine_key
+from .Inference import get_engine
+
+# Profile used when a model has not been tuned on this machine; matches
+# onnxruntime's own SessionOptions defaults.
+DEFAULT_PROFILE = {
+    'intra_op_num_threads': 0,          # 0 = let ORT decide
+    'inter_op_num_threads': 0,
+    'graph_optimization_level': 'all',
+    'execution_mode': 'sequential',
+    'enable_mem_pattern': True,
+    'enable_cpu_mem_arena': True,
+}
+
+OPTIMIZATION_LEVELS = {
+    'disabled': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    'sequential': onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+# Purposes a model keeps a separate winning profile for
+PURPOSE_LATENCY = 'latency'        # one image at a time (Classify tab)
+PURPOSE_THROUGHPUT = 'throughput'  # batched evaluation
+
+
+def profile_key(profile):
+    """Stable short string identifying a profile (for caches and logs)."""
+    profile = dict(DEFAULT_PROFILE, **(profile or {}))
+    return json.dumps({k: profile[k] for k in sorted(DEFAULT_PROFILE)},
+                      separators=(',', ':'))
+
+
+def make_session_options(profile=None):
+    """Build onnxruntime.SessionOptions from a profile dict."""
+    profile = dict(DEFAULT_PROFILE, **(profile or {}))
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = int(profile['intra_op_num_threads'])
+    options.inter_op_num_threads = int(profile['inter_op_num_threads'])
+    options.graph_optimization_level = OPTIMIZATION_LEVELS[profile['graph_optimization_level']]
+    options.execution_mode = EXECUTION_MODES[profile['execution_mode']]
+    options.enable_mem_pattern = bool(profile['enable_mem_pattern'])
+    options.enable_cpu_mem_arena = bool(profile['enable_cpu_mem_arena'])
+    return options
+
+
+def candidate_profiles(cores=None):
+    """
+    Configurations worth timing on a machine with `cores` CPUs: the ORT
+    defaults, each intra-op thread count, and a few variants at full width.
+    """
+    cores = cores or os.cpu_count() or 1
+    candidates = [dict(DEFAULT_PROFILE)]
+    for threads in sorted({1, max(1, cores // 2), cores}):
+        candidates.append(dict(DEFAULT_PROFILE, intra_op_num_threads=threads))
+    full = dict(DEFAULT_PROFILE, intra_op_num_threads=cores)
+    candidates.extend([
+        dict(full, graph_optimization_level='extended'),
+        dict(full, enable_mem_pattern=False),
+        dict(full, enable_cpu_mem_arena=False),
+        dict(full, execution_mode='parallel', inter_op_num_threads=2),
+    ])
+    # Drop duplicates (e.g. cores == 1) while keeping order
+    unique = {}
+    for profile in candidates:
+        unique.setdefault(profile_key(profile), profile)
+    return list(unique.values())
+
+
+def process_rss():
+    """Resident memory of this process in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    try:
+        import resource  # Peak, not current, RSS; better than nothing
+        scale = 1 if os.uname().sysname == 'Darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    except Exception:
+        return None
+
+
+def available_memory():
+    """Memory available to new allocations in bytes, or None if unknown."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _synthetic_input(session, batch_size):
+    """Random input matching the model's input, symbolic dims filled in."""
+    model_input = session.get_inputs()[0]
+    shape = list(model_input.shape)
+    raw = model_input.type == 'tensor(uint8)'
+    # (N, C, H, W) or (N, H, W, C) for raw inputs
+    spatial = (1, 2) if raw else (2, 3)
+    defaults = {0: batch_size, spatial[0]: INPUT_SIZE[1], spatial[1]: INPUT_SIZE[0]}
+    for axis, dim in enumerate(shape):
+        if not isinstance(dim, int) or dim <= 0:
+            shape[axis] = defaults.get(axis, 3)
+
+    rng = np.random.default_rng(0)
+    if raw:
+        return rng.integers(0, 256, size=shape, dtype=np.uint8)
+    return rng.standard_normal(shape).astype(np.float32)
+
+
+def benchmark_profile(model_path, profile, batch_size=8, repeats=10):
+    """
+    Time one profile on this machine.
+
+    Returns
+    -------
+    dict
+        'latency_ms': median single-image run, 'throughput': images/s
+        over batches of batch_size, 'load_ms': session creation time,
+        'memory_mb': RSS growth from creating and running the session
+        (None where RSS cannot be read).
+    """
+    gc.collect()
+    rss_before = process_rss()
+    start = time.perf_counter()
+    session = onnxruntime.InferenceSession(model_path, sess_options=make_session_options(profile))
+    load_ms = (time.perf_counter() - start) * 1000.0
+    engine = get_engine(session)
+
+    single = _synthetic_input(session, 1)[:1]
+    batch = _synthetic_input(session, batch_size)
+    if len(batch) < batch_size:
+        batch = np.concatenate([batch] * -(-batch_size // len(batch)))[:batch_size]
+
+    # Warm up: first runs allocate arenas and pick kernels
+    engine.run(single)
+    engine.predict(batch, max_batch=batch_size)
+    rss_after = process_rss()
+    memory_mb = None
+    if rss_before is not None and rss_after is not None:
+        memory_mb = max(0.0, (rss_after - rss_before) / (1024 * 1024))
+
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        engine.run(single)
+        times.append(time.perf_counter() - t0)
+    latency_ms = float(np.median(times)) * 1000.0
+
+    rounds = max(1, repeats // 2)
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        engine.predict(batch, max_batch=batch_size)
+    throughput = rounds * batch_size / (time.perf_counter() - t0)
+
+    return {'latency_ms': latency_ms, 'throughput': throughput,
+            'load_ms': load_ms, 'memory_mb': memory_mb}
+
+
+def benchmark_isolated(model_path, profile=None, batch_size=8, repeats=10):
+    """
+    benchmark_profile in a fresh process, so memory_mb is not skewed by
+    heap the current process already grew for other sessions.
+    """
+    with mp.get_context('spawn').Pool(1) as pool:
+        return pool.apply(benchmark_profile, (model_path, profile, batch_size, repeats))
+
+
+def autotune(model_path, batch_size=8, repeats=10, candidates=None, progress=None):
+    """
+    Benchmark candidate profiles for a model and pick separate winners for
+    single-image latency and batch throughput.
+
+    Parameters
+    ----------
+    model_path : str
+        ONNX model to tune.
+    batch_size : int
+        Batch used for the throughput measurement.
+    repeats : int
+        Timed runs per candidate.
+    candidates : list of dict, optional
+        Profiles to try; defaults to candidate_profiles().
+    progress : callable, optional
+        progress(done, total) after each candidate.
+
+    Returns
+    -------
+    dict
+        {'machine', 'tuned_at', 'latency': {'profile', 'latency_ms'},
+         'throughput': {'profile', 'throughput'}, 'results': [...]}
+
+    Raises
+    ------
+    RuntimeError if no candidate could be benchmarked.
+    """
+    candidates = candidates or candidate_profiles()
+    results = []
+    for done, profile in enumerate(candidates, 1):
+        try:
+            stats = benchmark_profile(model_path, profile, batch_size, repeats)
+            results.append(dict(stats, profile=profile))
+        except Exception:
+            pass  # Configuration not supported by this model/build
+        if progress is not None:
+            progress(done, len(candidates))
+
+    if not results:
+        raise RuntimeError("No session profile could be benchmarked.")
+
+    fastest = min(results, key=lambda r: r['latency_ms'])
+    widest = max(results, key=lambda r: r['throughput'])
+    return {
+        'machine': machine_key(),
+        'tuned_at': datetime.now().isoformat(),
+        PURPOSE_LATENCY: {'profile': fastest['profile'],
+                          'latency_ms': round(fastest['latency_ms'], 3)},
+        PURPOSE_THROUGHPUT: {'profile': widest['profile'],
+                             'throughput': round(widest['throughput'], 2),
+                             'batch_size': batch_size},
+        'results': [
+            {'profile': r['profile'],
+             'latency_ms': round(r['latency_ms'], 3),
+             'throughput': round(r['throughput'], 2)}
+            for r in results
+        ],
+    }
+
+
+def _node_events(trace):
+    """Per-node kernel events of an ORT profiling trace, warm-up run excluded."""
+    runs = sorted((e for e in trace if e.get('cat') == 'Session' and e.get('name') == 'model_run'),
+                  key=lambda e: e['ts'])
+    cutoff = runs[0]['ts'] + runs[0]['dur'] if runs else 0
+    return [e for e in trace
+            if e.get('cat') == 'Node' and e.get('name', '').endswith('_kernel_time')
+            and e['ts'] >= cutoff]
+
+
+def profile_operators(model_path, profile=None, runs=20, batch_size=1, top=15):
+    """
+    Run a model with ONNX Runtime profiling enabled and summarise where
+    the time and memory go, per operator type and per node.
+
+    One untimed warm-up run precedes the `runs` profiled ones. Times are
+    milliseconds per run; shares are fractions of the total node time.
+
+    Returns
+    -------
+    dict
+        {'machine', 'profiled_at', 'runs', 'batch_size', 'total_ms',
+         'peak_arena_mb', 'operators': [{'op_type', 'nodes', 'time_ms',
+         'share', 'output_mb'}], 'nodes': the `top` slowest nodes as
+         [{'name', 'op_type', 'time_ms', 'share', 'output_mb',
+         'activation_mb', 'parameter_mb'}]}
+    """
+    options = make_session_options(profile)
+    with tempfile.TemporaryDirectory() as tmp:
+        options.enable_profiling = True
+        options.profile_file_prefix = os.path.join(tmp, 'ort_profile')
+        session = onnxruntime.InferenceSession(model_path, sess_options=options)
+        engine = get_engine(session)
+        batch = _synthetic_input(session, batch_size)
+        for _ in range(runs + 1):
+            engine.run(batch)
+        with open(session.end_profiling()) as f:
+            events = _node_events(json.load(f))
+
+    mb = 1.0 / (1024 * 1024)
+    nodes = {}
+    for event in events:
+        name = event['name'][:-len('_kernel_time')]
+        args = event.get('args', {})
+        node = nodes.setdefault(name, {
+            'name': name,
+            'op_type': args.get('op_name', '?'),
+            'time_ms': 0.0,
+            'output_mb': int(args.get('output_size', 0)) * mb,
+            'activation_mb': int(args.get('activation_size', 0)) * mb,
+            'parameter_mb': int(args.get('parameter_size', 0)) * mb,
+        })
+        node['time_ms'] += event['dur'] / 1000.0 / runs  # Trace durations are in µs
+    total_ms = sum(node['time_ms'] for node in nodes.values()) or 1e-9
+    peak_arena = max((int(e.get('args', {}).get('mem_arena_held', 0)) for e in events), default=0)
+
+    operators = defaultdict(lambda: {'nodes': 0, 'time_ms': 0.0, 'output_mb': 0.0})
+    for node in nodes.values():
+        node['share'] = node['time_ms'] / total_ms
+        op = operators[node['op_type']]
+        op['nodes'] += 1
+        op['time_ms'] += node['time_ms']
+        op['output_mb'] += node['output_mb']
+
+    def rounded(entry):
+        return {k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()}
+
+    slowest = sorted(nodes.values(), key=lambda n: n['time_ms'], reverse=True)[:top]
+    return {
+        'machine': machine_key(),
+        'profiled_at': datetime.now().isoformat(),
+        'runs': runs,
+        'batch_size': batch_size,
+        'total_ms': round(total_ms, 3),
+        'peak_arena_mb': round(peak_arena * mb, 2),
+        'operators': sorted(
+            (rounded(dict({'op_type': op_type}, **op, share=op['time_ms'] / total_ms))
+             for op_type, op in operators.items()),
+            key=lambda op: op['time_ms'], reverse=True),
+        'nodes': [rounded(node) for node in slowest],
+    }
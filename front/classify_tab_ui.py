@@ -9,8 +9,9 @@ import numpy as np
 
 from front.config import ENABLE_DRAG_DROP, APPLE_COLORS, FONTS, IMAGE_PREVIEW_SIZE
 from front.drag_drop_handler import DropZone, DragDropHandler
-from backend.ImagePreprocessing import preprocess_image
-from backend.Inference import predict_image
+from backend.CompositeModels import STAGE_EXPERT
+from backend.ImagePreprocessing import default_spec, compile_transform, get_transform, load_preview_image
+from backend.InferenceService import get_service
 
 class ClassifyTabUI:
     def __init__(self, app, parent):
@@ -142,11 +143,8 @@ class ClassifyTabUI:
         loading_label.pack(expand=True)
         
         try:
-            # Load image
-            pil_img = Image.open(path)
-            
-            # Calculate size to fit in preview maintaining aspect ratio
-            pil_img.thumbnail(self.preview_size, Image.Resampling.LANCZOS)
+            # Load image at reduced scale to fit in preview maintaining aspect ratio
+            pil_img = load_preview_image(path, self.preview_size)
             
             # Create gray background
             bg = Image.new('RGB', self.preview_size, APPLE_COLORS['separator'])
@@ -185,10 +183,33 @@ class ClassifyTabUI:
             loading_label.config(text="Failed to load image")
             return
         
-        # Preprocess image
+        # Preprocess with the current model's compiled transform once the
+        # model is loaded; the load runs on the background loader, so a
+        # drop while a model loads does not freeze the window
+        self.current_path = path
+        self.image_data = None
+        self.analyze_btn.config(state='disabled')
+        model_manager = self.app.model_manager
+        if not model_manager.current_model_name:
+            self._preprocess(path, None, loading_label)
+            return
+        
+        loading_label.config(text="Waiting for model...")
+        future = model_manager.load_model_async(model_manager.current_model_name)
+        future.add_done_callback(lambda f: self.app.root.after(
+            0, lambda: self._preprocess(path, f, loading_label)))
+
+    def _preprocess(self, path, future, loading_label):
+        """Preprocess a loaded image once the current model's load finished"""
+        if path != self.current_path:
+            return  # Another image was loaded or the view was cleared meanwhile
+        
         try:
-            self.image_data = preprocess_image(path)
-            self.current_path = path
+            sess = None  # Unloadable model: fall back to the default spec
+            if future is not None and future.exception() is None:
+                sess = future.result()
+            transform = get_transform(sess) if sess else compile_transform(default_spec())
+            self.image_data = transform([path])
             
             # Enable analyze button
             self.analyze_btn.config(state='normal')
@@ -224,32 +245,67 @@ class ClassifyTabUI:
         )
         analyzing_label.pack(expand=True)
         
-        # Start analysis thread
-        threading.Thread(target=self._predict, daemon=True).start()
+        self._predict()
 
     def _predict(self):
-        """Run prediction in background"""
-        sess = self.app.model_manager.get_current_model()
-        if not sess:
-            self.app.root.after(0, lambda: self._show_error("No model loaded"))
+        """Queue the prediction on the model's inference service"""
+        model_manager = self.app.model_manager
+        model_name = model_manager.current_model_name
+        if not model_name:
+            self._show_error("No model loaded")
             return
         
         # Update progress
-        self.app.root.after(0, lambda: self.progress.configure(value=30))
-        
+        self.progress.configure(value=30)
+        
+        image_data = self.image_data
+        
+        def run():
+            # Acquiring may (re)load the model or a composite's members,
+            # so it stays off the Tk thread. The lease lasts until the
+            # prediction is done, so a running evaluation cannot evict it.
+            try:
+                sess = model_manager.acquire_model(model_name)
+            except Exception as e:
+                msg = f"Failed to load model: {str(e)}"
+                self.app.root.after(0, lambda: self._show_error(msg))
+                return
+            future = get_service(sess).submit(image_data)
+            future.add_done_callback(lambda f: model_manager.release_model(model_name))
+            future.add_done_callback(
+                lambda f: self.app.root.after(0, lambda: self._on_prediction(sess, f)))
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    def _on_prediction(self, sess, future):
+        """Prediction finished on the inference worker"""
         try:
-            probs = predict_image(sess, self.image_data)
+            probs = future.result()[0]
         except Exception as e:
-            self.app.root.after(0, lambda: self._show_error(f"Analysis failed: {str(e)}"))
+            self._show_error(f"Analysis failed: {str(e)}")
             return
         
+        # Cascades report which member model decided the image
+        decided_by = None
+        stages = getattr(future, 'stages', None)
+        if stages:
+            stage = stages[0]
+            member = sess.expert if stage == STAGE_EXPERT else sess.screener
+            decided_by = f"{member} ({stage})"
+        
+        # Ensembles report every member's own prediction
+        member_results = None
+        outputs = getattr(future, 'member_outputs', None)
+        if outputs is not None:
+            member_results = [(member, out[0]) for member, out in zip(sess.members, outputs)]
+        
         # Update progress
-        self.app.root.after(0, lambda: self.progress.configure(value=100))
+        self.progress.configure(value=100)
         
         # Display results
-        self.app.root.after(100, lambda: self._display(probs))
+        self.app.root.after(100, lambda: self._display(probs, decided_by, member_results))
 
-    def _display(self, probs):
+    def _display(self, probs, decided_by=None, member_results=None):
         """Display prediction results"""
         names = ["COVID-19", "Normal", "Pneumonia-Bacterial", "Pneumonia-Viral"]
         
@@ -315,18 +371,34 @@ class ClassifyTabUI:
             prob_label.pack(anchor='w', pady=2)
         
         # Model info
+        model_name = self.app.model_manager.current_model_name
+        model_text = f"Model: {model_name}"
+        if decided_by:
+            model_text += f" - decided by {decided_by}"
         model_label = ttk.Label(
             result_container,
-            text=f"Model: {self.app.model_manager.current_model_name}",
+            text=model_text,
             style="AppleSecondary.TLabel"
         )
         model_label.pack(anchor='w', pady=(15, 0))
         
+        # Ensemble members' individual predictions
+        for member, member_probs in member_results or []:
+            idx = int(member_probs.argmax())
+            member_label = ttk.Label(
+                result_container,
+                text=f"  {member}: {names[idx]} ({member_probs[idx]*100:.1f}%)",
+                style="AppleSecondary.TLabel"
+            )
+            member_label.pack(anchor='w', pady=1)
+        
         # Save to history
+        if decided_by:
+            model_name = f"{model_name} [{decided_by}]"
         full_results = "\n".join([f"{n}: {p*100:.2f}%" for n, p in zip(names, probs)])
         self.app.history_manager.add_entry(
             self.current_path,
-            self.app.model_manager.current_model_name,
+            model_name,
             max_name,
             full_results
         )
@@ -207,6 +207,8 @@ class ConfusionMatrixHistoryTabUI:
                         lines.append(f"Rec: {value}")
                     elif metric.lower() == 'f1':
                         lines.append(f"F1: {value}")
+                    elif metric.lower() == 'escalated':
+                        lines.append(f"Esc: {value}")
             
             formatted_metrics = '\n'.join(lines)
             
@@ -376,6 +378,9 @@ class ConfusionMatrixHistoryTabUI:
             ("Recall", metrics.get('recall', 0), APPLE_COLORS['warning']),
             ("F1 Score", metrics.get('f1', 0), APPLE_COLORS['error'])
         ]
+        # Cascades: share of images the expert model had to decide
+        if 'escalated' in metrics:
+            metric_data.append(("Escalated", metrics['escalated'], APPLE_COLORS['text_secondary']))
         
         for name, value, color in metric_data:
             # Metric container
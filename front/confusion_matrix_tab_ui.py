@@ -7,9 +7,7 @@ from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
 
 from backend.ConfusionMatrixManager import ConfusionMatrixManager
-from backend.Evaluation import compute_confusion_matrix, compute_metrics
-from backend.ImagePreprocessing import preprocess_image
-from backend.Inference import predict_image
+from backend.Evaluation import evaluate_model, list_dataset
 from front.config import APPLE_COLORS, FONTS, IMAGE_PREVIEW_SIZE
 from front.drag_drop_handler import DropZone
 
@@ -64,6 +62,15 @@ class ConfusionMatrixTabUI:
         )
         self.evaluate_btn.pack(side='bottom', pady=(20, 0))
         
+        # Throughput mode: spread batches over parallel model replicas
+        self.throughput_var = tk.BooleanVar(value=False)
+        throughput_check = ttk.Checkbutton(
+            self.dataset_container,
+            text="Throughput mode (parallel model replicas)",
+            variable=self.throughput_var
+        )
+        throughput_check.pack(side='bottom', pady=(10, 0))
+        
         # Progress indicators (hidden initially)
         self.progress_frame = ttk.Frame(self.dataset_container)
         
@@ -216,8 +223,8 @@ class ConfusionMatrixTabUI:
             self.app.show_notification("Please select a dataset folder", "error")
             return
         
-        sess = self.app.model_manager.get_current_model()
-        if not sess:
+        model_name = self.app.model_manager.current_model_name
+        if not model_name:
             error_msg = "No model loaded. Please select a model first."
             self.app.show_notification(error_msg, "error")
             return
@@ -240,60 +247,69 @@ class ConfusionMatrixTabUI:
         # Show progress
         self.progress_frame.pack(pady=(20, 0))
         self.progress['value'] = 0
+        self.progress_label.config(text=f"Loading model: {model_name}...")
+        
+        # Load on the background loader so the window stays responsive
+        throughput = self.throughput_var.get()
+        future = self.app.model_manager.load_model_async(model_name)
+        future.add_done_callback(lambda f: self.app.root.after(
+            0, lambda: self._on_model_loaded(model_name, throughput, f)))
+
+    def _on_model_loaded(self, model_name, throughput, future):
+        """Model load for an evaluation finished"""
+        error = future.exception()
+        if error is not None:
+            self._evaluation_complete(None, None, f"Failed to load model: {error}")
+            return
+        
         self.progress_label.config(text="Preparing evaluation...")
         
         # Start evaluation thread
-        threading.Thread(target=self._run_evaluation, daemon=True).start()
+        threading.Thread(target=self._run_evaluation, args=(model_name, throughput),
+                         daemon=True).start()
 
-    def _run_evaluation(self):
+    def _run_evaluation(self, model_name, throughput=False):
         """Run evaluation in background"""
-        sess = self.app.model_manager.get_current_model()
-        
-        # Count files
-        files = []
-        for idx, cls in enumerate(self.class_names):
-            folder = os.path.join(self.dataset_path, cls)
-            if not os.path.isdir(folder):
-                continue
-            for fn in os.listdir(folder):
-                if fn.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    files.append((idx, os.path.join(folder, fn)))
-        
-        total = len(files)
+        total = len(list_dataset(self.dataset_path, self.class_names))
         if total == 0:
             self.app.root.after(0, lambda: self._evaluation_complete(None, None, "No images found in dataset"))
             return
         
-        # Process images
-        y_true, y_pred = [], []
-        for i, (true_idx, path) in enumerate(files):
-            try:
-                tensor = preprocess_image(path)
-                probs = predict_image(sess, tensor)
-                pred_idx = int(probs.argmax())
-            except Exception:
-                pred_idx = 0
-            
-            y_true.append(true_idx)
-            y_pred.append(pred_idx)
-            
-            # Update progress
-            progress = int((i + 1) / total * 100)
-            self.app.root.after(0, lambda p=progress, c=i+1, t=total: (
+        def on_progress(done, total):
+            progress = int(done / total * 100)
+            self.app.root.after(0, lambda p=progress, c=done, t=total: (
                 self.progress.configure(value=p),
                 self.progress_label.config(text=f"Processing images: {c}/{t}")
             ))
         
-        # Compute confusion matrix and metrics
-        cm = compute_confusion_matrix(y_true, y_pred, len(self.class_names))
-        metrics = compute_metrics(cm)
+        # Preprocessing runs in worker processes; inference stays here
+        model_manager = self.app.model_manager
+        pool = None
+        try:
+            # The lease keeps the session loaded for the whole run, even if
+            # the Classify tab loads other models meanwhile
+            with model_manager.lease_model(model_name) as sess:
+                if throughput and not model_manager.is_composite(model_name):
+                    self.app.root.after(0, lambda: self.progress_label.config(
+                        text="Starting model replicas..."))
+                    pool = model_manager.create_replica_pool(model_name)
+                cm, metrics = evaluate_model(sess, self.dataset_path, self.class_names,
+                                             progress=on_progress, service=pool)
+        except Exception as e:
+            msg = f"Evaluation failed: {e}"
+            self.app.root.after(0, lambda: self._evaluation_complete(None, None, msg))
+            return
+        finally:
+            if pool is not None:
+                pool.close()
         
         # Save confusion matrix with full dataset path
         img_path = self.manager.save_confusion_matrix(
             cm,
             self.class_names,
-            self.app.model_manager.current_model_name,
-            self.dataset_path  # Pass full path
+            model_name,
+            self.dataset_path,  # Pass full path
+            metrics.get('escalated')
         )
         
         # Complete
@@ -416,6 +432,9 @@ class ConfusionMatrixTabUI:
             ("Recall", metrics['recall'], APPLE_COLORS['warning']),
             ("F1 Score", metrics['f1'], APPLE_COLORS['error'])
         ]
+        # Cascades: share of images the expert model had to decide
+        if 'escalated' in metrics:
+            metric_data.append(("Escalated", metrics['escalated'], APPLE_COLORS['text_secondary']))
         
         for name, value, color in metric_data:
             # Metric container
@@ -60,8 +60,8 @@ class EvaluateTabUI:
         if not folder or not os.path.isdir(folder):
             messagebox.showwarning("No folder", "Please select a valid dataset folder.")
             return
-        model_session = self.app.model_manager.get_current_model()
-        if not model_session:
+        model_name = self.app.model_manager.current_model_name
+        if not model_name:
             messagebox.showerror("Error", "No model loaded.")
             return
 
@@ -75,15 +75,28 @@ class EvaluateTabUI:
         self.progress['value'] = 0
         self.percent_lbl.config(text="0%")
 
+        # Load on the background loader so the window stays responsive
+        future = self.app.model_manager.load_model_async(model_name)
+        future.add_done_callback(lambda f: self.app.root.after(
+            0, lambda: self._on_model_loaded(folder, model_name, f)))
+
+    def _on_model_loaded(self, folder, model_name, future):
+        error = future.exception()
+        if error is not None:
+            self._finish_evaluate()
+            messagebox.showerror("Error", f"No model loaded: {error}")
+            return
+
         threading.Thread(
             target=self._evaluate_thread,
-            args=(folder, model_session),
+            args=(folder, model_name),
             daemon=True
         ).start()
 
-    def _evaluate_thread(self, folder, model_session):
-        # Run evaluation
-        cm, metrics = evaluate_model(model_session, folder, self.class_names)
+    def _evaluate_thread(self, folder, model_name):
+        # Run evaluation; the lease keeps the session from being evicted
+        with self.app.model_manager.lease_model(model_name) as model_session:
+            cm, metrics = evaluate_model(model_session, folder, self.class_names)
 
         # Update progress to 100%
         self.app.root.after(
@@ -105,7 +118,8 @@ class EvaluateTabUI:
             cm,
             self.class_names,
             os.path.basename(model_session._model_path),
-            os.path.basename(folder)
+            os.path.basename(folder),
+            metrics.get('escalated')
         )
 
         # Finish up UI reset
@@ -4,9 +4,10 @@ import os
 import re
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
+from PIL import ImageTk
 
 from backend.HistoryManager import HistoryManager
+from backend.ImagePreprocessing import load_preview_image
 from front.config import APPLE_COLORS, FONTS, MAX_HISTORY_DISPLAY
 from front.image_cache import ImageCache
 
@@ -331,21 +332,10 @@ class HistoryTabUI:
     def _display_image(self, parent, path):
         """Display image with proper scaling"""
         try:
-            # Load original image
-            img = Image.open(path)
-            
-            # Calculate scale to fit while maintaining aspect ratio
+            # Load at reduced scale; only scales down, maintaining aspect ratio
             max_width = 400
             max_height = 400
-            
-            # Calculate scaling factor
-            scale = min(max_width / img.width, max_height / img.height)
-            
-            # Only scale down, not up
-            if scale < 1:
-                new_width = int(img.width * scale)
-                new_height = int(img.height * scale)
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            img = load_preview_image(path, (max_width, max_height))
             
             photo = ImageTk.PhotoImage(img)
             
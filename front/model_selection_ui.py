@@ -2,11 +2,16 @@
 
 import os
 import csv
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+from backend.CompositeModels import ENSEMBLE_AVERAGE, ENSEMBLE_METHODS
 from backend.ModelManager import ModelManager
 from front.config import APPLE_COLORS, FONTS
 
+# Shown after a model's name in the combobox while it loads
+LOADING_SUFFIX = " (loading...)"
+
 class ModelSelectionUI:
     def __init__(self, app):
         """
@@ -15,8 +20,14 @@ class ModelSelectionUI:
         self.app = app
         self.models_dir = ModelManager.MODELS_DIR
         self.persist_file = os.path.join(self.models_dir, "selected_model.csv")
+        self._loading = set()       # Models whose background load we await
+        self._status_clear = None   # Pending auto-clear of the status label
         self._build_ui()
         
+        # Warm-up finishes on a worker thread; hop to the UI thread
+        self.app.model_manager.ready_callback = lambda name: self.app.root.after(
+            0, lambda: self._on_model_ready(name))
+        
         # Auto-load models after UI is built
         self.app.root.after(100, self._auto_load_models)
 
@@ -69,7 +80,43 @@ class ModelSelectionUI:
             command=self._remove_model,
             style="AppleSecondary.TButton"
         )
-        remove_btn.pack(side='left')
+        remove_btn.pack(side='left', padx=(0, 12))
+
+        # Autotune button
+        self.autotune_btn = ttk.Button(
+            btn_container, 
+            text="Autotune", 
+            command=self._autotune_model,
+            style="AppleSecondary.TButton"
+        )
+        self.autotune_btn.pack(side='left', padx=(0, 12))
+
+        # Profile button
+        self.profile_btn = ttk.Button(
+            btn_container, 
+            text="Profile", 
+            command=self._profile_model,
+            style="AppleSecondary.TButton"
+        )
+        self.profile_btn.pack(side='left', padx=(0, 12))
+
+        # Cascade button
+        cascade_btn = ttk.Button(
+            btn_container, 
+            text="Cascade...", 
+            command=self._create_cascade,
+            style="AppleSecondary.TButton"
+        )
+        cascade_btn.pack(side='left', padx=(0, 12))
+
+        # Ensemble button
+        ensemble_btn = ttk.Button(
+            btn_container, 
+            text="Ensemble...", 
+            command=self._create_ensemble,
+            style="AppleSecondary.TButton"
+        )
+        ensemble_btn.pack(side='left')
         
         # Status label
         self.status_label = ttk.Label(
@@ -81,25 +128,30 @@ class ModelSelectionUI:
 
     def _auto_load_models(self):
         """Auto-load models from registry"""
-        # First scan for models in the models directory
+        # Speculatively start loading the last selected model before the
+        # directory scan, which may have to hash new files
+        last_model = self._last_selected_model()
+        if last_model in self.app.model_manager.get_model_names():
+            self.model_var.set(last_model)
+            self._load_selected_model(last_model)
+        
+        # Scan for models in the models directory
         self._scan_and_register_models()
         
         # Then refresh the list
         self._refresh_model_list()
-        
-        # Load last selected model
+
+    def _last_selected_model(self):
+        """Most recent entry of selected_model.csv, or None"""
         if os.path.isfile(self.persist_file):
             try:
                 with open(self.persist_file, 'r', newline='') as f:
                     rows = list(csv.reader(f))
                     if len(rows) > 1:
-                        last_model = rows[-1][0]
-                        if last_model in self.model_combo['values']:
-                            self.model_var.set(last_model)
-                            # Actually load the model
-                            self._load_selected_model(last_model)
+                        return rows[-1][0]
             except Exception:
                 pass
+        return None
 
     def _scan_and_register_models(self):
         """Scan models directory and register any unregistered models"""
@@ -125,37 +177,86 @@ class ModelSelectionUI:
 
     def _refresh_model_list(self):
         """Refresh combobox values and set default selection"""
-        models = self.app.model_manager.get_model_names()
-        self.model_combo['values'] = models
+        models = self._update_model_values()
         
         if models:
             # Pick first if current not valid
-            sel = self.model_var.get()
+            sel = self._selected_name()
             if not sel or sel not in models:
                 sel = models[0]
                 self.model_var.set(sel)
             # Apply selection
             self.app.model_manager.set_current_model(sel)
             self._persist_selection(sel)
-            self._update_status(f"Model loaded: {sel}")
+            if sel not in self._loading:
+                self._update_status(f"Model loaded: {sel}")
         else:
             self.model_var.set('')
             self.app.model_manager.current_model_name = None
             self._update_status("No models available")
 
+    def _selected_name(self):
+        """Model name of the combobox selection, without the loading marker"""
+        name = self.model_var.get()
+        if name.endswith(LOADING_SUFFIX):
+            name = name[:-len(LOADING_SUFFIX)]
+        return name
+
+    def _update_model_values(self):
+        """Fill the combobox, marking models that are still loading"""
+        models = self.app.model_manager.get_model_names()
+        self.model_combo['values'] = [
+            name + LOADING_SUFFIX if name in self._loading else name for name in models
+        ]
+        selected = self._selected_name()
+        if selected:
+            self.model_var.set(selected + LOADING_SUFFIX if selected in self._loading else selected)
+        return models
+
     def _load_selected_model(self, model_name):
-        """Load the selected model"""
-        try:
-            self.app.model_manager.set_current_model(model_name)
-            if self.app.model_manager.ensure_model_loaded(model_name):
-                self._update_status(f"Model loaded: {model_name}")
-                self.app.show_notification(f"Model loaded: {model_name}", "success")
-            else:
-                self._update_status(f"Failed to load: {model_name}")
-                self.app.show_notification(f"Failed to load model: {model_name}", "error")
-        except Exception as e:
-            self._update_status(f"Error: {str(e)}")
-            self.app.show_notification(f"Model error: {str(e)}", "error")
+        """Load the selected model on the background loader"""
+        self.app.model_manager.set_current_model(model_name)
+        self._update_status(f"Loading: {model_name}...", sticky=True)
+        if model_name in self._loading:
+            return  # Already loading; its completion updates the UI
+        
+        self._loading.add(model_name)
+        self._update_model_values()
+        future = self.app.model_manager.load_model_async(model_name)
+        future.add_done_callback(lambda f: self.app.root.after(
+            0, lambda: self._on_model_loaded(model_name, f)))
+
+    def _on_model_loaded(self, model_name, future):
+        """Background load of a model finished"""
+        self._loading.discard(model_name)
+        self._update_model_values()
+        if model_name != self.app.model_manager.current_model_name:
+            return  # The user moved on while it loaded
+        
+        error = future.exception()
+        if error is not None:
+            self._update_status(f"Failed to load: {model_name}")
+            self.app.show_notification(f"Failed to load model: {str(error)}", "error")
+            return
+        
+        if self.app.model_manager.is_model_ready(model_name):
+            self._update_status(f"Model ready: {model_name}")
+        else:
+            self._update_status(f"Warming up: {model_name}...")
+        self.app.show_notification(f"Model loaded: {model_name}", "success")
+        
+        # Use spare memory budget for the model most likely to be picked next
+        self.app.model_manager.prefetch_next_model()
+
+    def _on_model_ready(self, model_name):
+        """Warm-up of a loaded model finished"""
+        model_manager = self.app.model_manager
+        current = model_manager.current_model_name
+        if model_name == current:
+            self._update_status(f"Model ready: {model_name}")
+        elif model_manager.is_composite(current) and model_manager.is_model_ready(current):
+            # Ready callbacks name members; a composite is ready with all of them
+            self._update_status(f"Model ready: {current}")
 
     def _persist_selection(self, model_name):
         """Append the chosen model to selected_model.csv"""
@@ -169,7 +270,7 @@ class ModelSelectionUI:
 
     def _on_selected(self, event=None):
         """User explicitly changed the combobox"""
-        name = self.model_var.get()
+        name = self._selected_name()
         if name:
             self._load_selected_model(name)
             self._persist_selection(name)
@@ -185,21 +286,109 @@ class ModelSelectionUI:
         if not path:
             return
         
-        try:
-            self._update_status("Importing model...")
-            imported_name = self.app.model_manager.import_model(path)
-            self._refresh_model_list()
-            # Select the newly imported model
-            self.model_var.set(imported_name)
-            self._load_selected_model(imported_name)
-            self.app.show_notification(f"Model imported: {imported_name}", "success")
-        except Exception as e:
-            self.app.show_notification(f"Import failed: {str(e)}", "error")
-            self._update_status("Import failed")
+        # Optionally fold normalization and softmax into the graph
+        fold = messagebox.askyesno(
+            "Import Model",
+            "Build an optimized variant with image normalization and softmax "
+            "inside the model graph?\n\n"
+            "Recommended for models trained on ImageNet-normalized BGR input.",
+            parent=self.app.root
+        )
+        
+        # Optionally build an INT8 variant; a dataset enables static
+        # calibration and an accuracy check, otherwise quantize dynamically
+        quantize = messagebox.askyesno(
+            "Import Model",
+            "Also build an INT8 quantized variant?\n\n"
+            "It is smaller and usually faster on the Raspberry Pi. Next, choose "
+            "a dataset folder (one subfolder per class) for calibration and an "
+            "accuracy check, or cancel to quantize without data.",
+            parent=self.app.root
+        )
+        dataset_path = None
+        if quantize:
+            dataset_path = filedialog.askdirectory(
+                title="Select Calibration Dataset (Cancel for dynamic quantization)",
+                parent=self.app.root
+            ) or None
+        
+        self._update_status("Importing model...")
+        
+        def on_progress(done, total):
+            percent = int(done / total * 100) if total else 100
+            self.app.root.after(0, lambda: self.status_label.config(
+                text=f"Importing model... {percent}%"))
+        
+        # Copying and hashing a large model must not block the UI
+        def run():
+            try:
+                imported_name = self.app.model_manager.import_model(
+                    path, fold_preprocessing=fold, progress=on_progress)
+            except Exception as e:
+                msg = f"Import failed: {str(e)}"
+                self.app.root.after(0, lambda: (
+                    self.app.show_notification(msg, "error"),
+                    self._update_status("Import failed")))
+                return
+            self.app.root.after(0, lambda: self._on_imported(imported_name, quantize, dataset_path))
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    def _on_imported(self, imported_name, quantize, dataset_path):
+        """Import finished on the worker thread"""
+        self._refresh_model_list()
+        # Select the newly imported model
+        self.model_var.set(imported_name)
+        self._load_selected_model(imported_name)
+        # Clear classify tab to avoid result confusion
+        self.app.tabs_ui.clear_image_and_result()
+        self.app.show_notification(f"Model imported: {imported_name}", "success")
+        
+        if quantize:
+            self._quantize_model(imported_name, dataset_path)
+
+    def _quantize_model(self, model_name, dataset_path=None):
+        """Build and benchmark an INT8 variant in the background"""
+        mode = 'static' if dataset_path else 'dynamic'
+        class_names = self.app.tabs_ui.evaluate_tab_ui.class_names
+        self._update_status(f"Quantizing {model_name} ({mode})...")
+        
+        def run():
+            try:
+                quant_name = self.app.model_manager.create_quantized_model(
+                    model_name, mode, dataset_path, class_names)
+                report = self.app.model_manager.get_model_info(quant_name)['quantization_report']
+                msg = f"INT8 model ready: {quant_name}\n{self._format_quantization_report(report)}"
+                self.app.root.after(0, lambda: (
+                    self._refresh_model_list(),
+                    self.app.show_notification(msg, "success", 5000)
+                ))
+            except Exception as e:
+                msg = f"Quantization failed: {str(e)}"
+                self.app.root.after(0, lambda: self.app.show_notification(msg, "error"))
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    @staticmethod
+    def _format_quantization_report(report):
+        """One-line-per-metric summary of an FP32 vs INT8 comparison"""
+        lines = []
+        size = report['size_mb']
+        lines.append(f"Size: {size['fp32']:.1f} -> {size['int8']:.1f} MB")
+        latency = report['latency_ms']
+        lines.append(f"Latency: {latency['fp32']:.1f} -> {latency['int8']:.1f} ms")
+        memory = report['memory_mb']
+        if memory['fp32'] is not None and memory['int8'] is not None:
+            lines.append(f"Memory: {memory['fp32']:.0f} -> {memory['int8']:.0f} MB")
+        accuracy = report.get('accuracy')
+        if accuracy:
+            lines.append(f"Accuracy: {accuracy['fp32']:.1%} -> {accuracy['int8']:.1%} "
+                         f"({accuracy['delta']:+.1%}, {accuracy['images']} images)")
+        return "\n".join(lines)
 
     def _remove_model(self):
         """Remove selected model"""
-        name = self.model_var.get()
+        name = self._selected_name()
         if not name:
             self.app.show_notification("No model selected", "warning")
             return
@@ -215,10 +404,247 @@ class ModelSelectionUI:
         if result:
             self.app.model_manager.remove_model(name)
             self._refresh_model_list()
+            # The selection moved off the removed model; drop its result
+            self.app.tabs_ui.clear_image_and_result()
             self.app.show_notification(f"Model removed: {name}", "info")
 
-    def _update_status(self, message):
-        """Update status label"""
+    def _autotune_model(self):
+        """Benchmark session settings for the selected model on this machine"""
+        name = self._selected_name()
+        if not name:
+            self.app.show_notification("No model selected", "warning")
+            return
+        
+        self.autotune_btn.config(state='disabled')
+        self._update_status(f"Autotuning {name}...")
+        
+        def on_progress(done, total):
+            self.app.root.after(0, lambda: self._update_status(
+                f"Autotuning {name}: {done}/{total}"))
+        
+        def run():
+            try:
+                result = self.app.model_manager.autotune_model(name, progress=on_progress)
+                msg = (f"Autotuned {name}: {result['latency']['latency_ms']:.1f} ms/image, "
+                       f"{result['throughput']['throughput']:.1f} images/s batched")
+                self.app.root.after(0, lambda: self.app.show_notification(msg, "success", 3000))
+            except Exception as e:
+                msg = f"Autotune failed: {str(e)}"
+                self.app.root.after(0, lambda: self.app.show_notification(msg, "error"))
+            finally:
+                self.app.root.after(0, lambda: self.autotune_btn.config(state='normal'))
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    def _profile_model(self):
+        """Profile the selected model per operator on this machine"""
+        name = self._selected_name()
+        if not name:
+            self.app.show_notification("No model selected", "warning")
+            return
+        if self.app.model_manager.is_composite(name):
+            self.app.show_notification("Profile the member models of a composite", "warning")
+            return
+        
+        self.profile_btn.config(state='disabled')
+        self._update_status(f"Profiling {name}...")
+        
+        def run():
+            try:
+                report = self.app.model_manager.profile_model(name)
+                self.app.root.after(0, lambda: self._show_operator_profile(name, report))
+            except Exception as e:
+                msg = f"Profiling failed: {str(e)}"
+                self.app.root.after(0, lambda: self.app.show_notification(msg, "error"))
+            finally:
+                self.app.root.after(0, lambda: self.profile_btn.config(state='normal'))
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    def _show_operator_profile(self, model_name, report):
+        """Window listing a profile report's operator types and slowest nodes"""
+        dialog = tk.Toplevel(self.app.root)
+        dialog.title(f"Operator Profile - {model_name}")
+        dialog.transient(self.app.root)
+        
+        frame = ttk.Frame(dialog)
+        frame.pack(fill='both', expand=True, padx=20, pady=16)
+        
+        summary = (f"{report['total_ms']:.2f} ms per run (batch {report['batch_size']}, "
+                   f"{report['runs']} runs) - peak arena {report['peak_arena_mb']:.1f} MB")
+        ttk.Label(frame, text=summary, style="AppleBody.TLabel").pack(anchor='w', pady=(0, 10))
+        
+        sections = [
+            ("By operator type", report['operators'],
+             ('op_type', 'nodes', 'time_ms', 'share', 'output_mb'),
+             ("Operator", "Nodes", "ms/run", "Share", "Output MB")),
+            ("Slowest nodes", report['nodes'],
+             ('name', 'op_type', 'time_ms', 'share', 'output_mb', 'activation_mb', 'parameter_mb'),
+             ("Node", "Operator", "ms/run", "Share", "Output MB", "Activation MB", "Parameter MB")),
+        ]
+        for title, rows, keys, headings in sections:
+            ttk.Label(frame, text=title, style="AppleSecondary.TLabel").pack(anchor='w', pady=(6, 2))
+            tree = ttk.Treeview(frame, columns=keys, show='headings', height=min(len(rows), 10))
+            for key, heading in zip(keys, headings):
+                tree.heading(key, text=heading)
+                tree.column(key, width=180 if key == 'name' else 100, anchor='w')
+            for row in rows:
+                values = []
+                for key in keys:
+                    value = row[key]
+                    if key == 'share':
+                        value = f"{value:.1%}"
+                    elif isinstance(value, float):
+                        value = f"{value:.3f}"
+                    values.append(value)
+                tree.insert('', 'end', values=values)
+            tree.pack(fill='x')
+
+    def _create_cascade(self):
+        """Dialog pairing a fast screener with an expert model"""
+        manager = self.app.model_manager
+        models = [m for m in manager.get_model_names() if not manager.is_composite(m)]
+        if len(models) < 2:
+            self.app.show_notification("A cascade needs at least two models", "warning")
+            return
+        
+        dialog = tk.Toplevel(self.app.root)
+        dialog.title("Create Cascade")
+        dialog.transient(self.app.root)
+        dialog.resizable(False, False)
+        
+        frame = ttk.Frame(dialog)
+        frame.pack(fill='both', expand=True, padx=20, pady=16)
+        
+        screener_var = tk.StringVar(value=models[0])
+        expert_var = tk.StringVar(value=models[1])
+        threshold_var = tk.StringVar(value="0.90")
+        
+        rows = [
+            ("Screener (runs on every image):", ttk.Combobox(
+                frame, textvariable=screener_var, values=models, state='readonly', width=36)),
+            ("Expert (runs on uncertain images):", ttk.Combobox(
+                frame, textvariable=expert_var, values=models, state='readonly', width=36)),
+            ("Escalate below confidence:", ttk.Spinbox(
+                frame, textvariable=threshold_var, from_=0.05, to=1.0, increment=0.05,
+                format="%.2f", width=8)),
+        ]
+        for row, (text, widget) in enumerate(rows):
+            ttk.Label(frame, text=text, style="AppleBody.TLabel").grid(
+                row=row, column=0, sticky='w', pady=4, padx=(0, 12))
+            widget.grid(row=row, column=1, sticky='w', pady=4)
+        
+        def create():
+            try:
+                threshold = float(threshold_var.get())
+            except ValueError:
+                self.app.show_notification("Threshold must be a number", "error")
+                return
+            screener, expert = screener_var.get(), expert_var.get()
+            self._create_composite(
+                dialog, create_btn, "Cascade",
+                lambda: manager.create_cascade(screener, expert, threshold))
+        
+        create_btn = ttk.Button(
+            frame, 
+            text="Create", 
+            command=create,
+            style="AppleSecondary.TButton"
+        )
+        create_btn.grid(row=len(rows), column=1, sticky='e', pady=(12, 0))
+        dialog.grab_set()
+
+    def _create_composite(self, dialog, button, kind, build):
+        """
+        Run build() (a create_cascade/create_ensemble call) on a worker
+        thread: checking the members loads them, which must not block the
+        UI. Selects the new model once it is registered.
+        """
+        button.config(state='disabled')
+        self._update_status(f"Creating {kind.lower()}...", sticky=True)
+        
+        def run():
+            try:
+                name = build()
+            except Exception as e:
+                msg = f"{kind} failed: {str(e)}"
+                self.app.root.after(0, lambda: self._on_composite_failed(dialog, button, msg))
+                return
+            self.app.root.after(0, lambda: self._on_composite_created(dialog, kind, name))
+        
+        threading.Thread(target=run, daemon=True).start()
+
+    def _on_composite_created(self, dialog, kind, name):
+        """Composite registered on the worker thread"""
+        if dialog.winfo_exists():
+            dialog.destroy()
+        self._refresh_model_list()
+        self.model_var.set(name)
+        self._load_selected_model(name)
+        self._persist_selection(name)
+        self.app.tabs_ui.clear_image_and_result()
+        self.app.show_notification(f"{kind} created: {name}", "success")
+
+    def _on_composite_failed(self, dialog, button, message):
+        """Composite creation failed on the worker thread"""
+        if dialog.winfo_exists():
+            button.config(state='normal')
+        self._update_status("")
+        self.app.show_notification(message, "error")
+
+    def _create_ensemble(self):
+        """Dialog combining several models on the same preprocessed image"""
+        manager = self.app.model_manager
+        models = [m for m in manager.get_model_names() if not manager.is_composite(m)]
+        if len(models) < 2:
+            self.app.show_notification("An ensemble needs at least two models", "warning")
+            return
+        
+        dialog = tk.Toplevel(self.app.root)
+        dialog.title("Create Ensemble")
+        dialog.transient(self.app.root)
+        dialog.resizable(False, False)
+        
+        frame = ttk.Frame(dialog)
+        frame.pack(fill='both', expand=True, padx=20, pady=16)
+        
+        ttk.Label(frame, text="Members:", style="AppleBody.TLabel").grid(
+            row=0, column=0, sticky='nw', pady=4, padx=(0, 12))
+        members_list = tk.Listbox(frame, selectmode='multiple', exportselection=False,
+                                  height=min(len(models), 8), width=38)
+        for model in models:
+            members_list.insert('end', model)
+        members_list.grid(row=0, column=1, sticky='w', pady=4)
+        
+        method_var = tk.StringVar(value=ENSEMBLE_AVERAGE)
+        ttk.Label(frame, text="Combine by:", style="AppleBody.TLabel").grid(
+            row=1, column=0, sticky='w', pady=4, padx=(0, 12))
+        ttk.Combobox(frame, textvariable=method_var, values=ENSEMBLE_METHODS,
+                     state='readonly', width=12).grid(row=1, column=1, sticky='w', pady=4)
+        
+        def create():
+            members = [models[i] for i in members_list.curselection()]
+            method = method_var.get()
+            self._create_composite(
+                dialog, create_btn, "Ensemble",
+                lambda: manager.create_ensemble(members, method))
+        
+        create_btn = ttk.Button(
+            frame, 
+            text="Create", 
+            command=create,
+            style="AppleSecondary.TButton"
+        )
+        create_btn.grid(row=2, column=1, sticky='e', pady=(12, 0))
+        dialog.grab_set()
+
+    def _update_status(self, message, sticky=False):
+        """Update status label; sticky messages stay until replaced"""
         self.status_label.config(text=message)
+        if self._status_clear is not None:
+            self.app.root.after_cancel(self._status_clear)
+            self._status_clear = None
         # Auto-clear after 3 seconds
-        self.app.root.after(3000, lambda: self.status_label.config(text=""))
\ No newline at end of file
+        if not sticky:
+            self._status_clear = self.app.root.after(
+                3000, lambda: self.status_label.config(text=""))
\ No newline at end of file
@@ -0,0 +1,85 @@
+# tests/test_preprocessing_equivalence.py
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from backend import ImagePreprocessing
+from backend.ImagePreprocessing import (BACKENDS, EQUIVALENCE_ATOL, GRAYSCALE_MEAN, GRAYSCALE_STD,
+                                        IMAGENET_MEAN, IMAGENET_STD, PreprocessSpec,
+                                        PreprocessTransform, _match_histogram, _resize_linear,
+                                        _write_validation_sources, default_spec,
+                                        reference_backend)
+
+SPECS = {
+    'bgr256': default_spec(3),
+    'gray256': default_spec(1),
+    'raw256': default_spec(3, raw=True),
+    'rgb224': PreprocessSpec((224, 224), 3, IMAGENET_MEAN, IMAGENET_STD, 'RGB', False),
+    'gray320x240': PreprocessSpec((320, 240), 1, GRAYSCALE_MEAN, GRAYSCALE_STD, 'BGR', False),
+}
+CANDIDATES = [name for name, backend in BACKENDS.items()
+              if backend.is_available() and name != reference_backend()]
+
+
+def _max_diff(a, b):
+    return float(np.max(np.abs(a.astype(np.float32) - b.astype(np.float32))))
+
+
+@pytest.fixture
+def sources(tmp_path):
+    """Synthetic sources at the size of each spec, keyed by spec name."""
+    def write(spec):
+        directory = tmp_path / f"{spec.size[0]}x{spec.size[1]}"
+        directory.mkdir(exist_ok=True)
+        return _write_validation_sources(str(directory), spec.size)
+    return write
+
+
+@pytest.mark.parametrize("shape,size", [
+    ((2400, 2000), (256, 256)),
+    ((601, 499, 3), (224, 224)),
+    ((100, 90), (256, 256)),
+    ((257, 255, 3), (320, 240)),
+    ((512, 512), (256, 256)),
+])
+def test_resize_linear_matches_opencv_for_uint8(shape, size):
+    image = np.random.default_rng(0).integers(0, 256, size=shape, dtype=np.uint8)
+    np.testing.assert_array_equal(_resize_linear(image, size), cv2.resize(image, size))
+
+
+@pytest.mark.parametrize("shape", [(120, 100), (120, 100, 3)])
+def test_match_histogram_same_without_opencv(shape, monkeypatch):
+    rng = np.random.default_rng(1)
+    reference_cdf = np.cumsum(np.bincount(rng.integers(0, 256, 5000), minlength=256),
+                              dtype=np.float64)
+    reference_cdf /= reference_cdf[-1]
+    image = rng.integers(0, 256, size=shape, dtype=np.uint8)
+    expected = _match_histogram(image, reference_cdf)
+    monkeypatch.setattr(ImagePreprocessing, 'cv2', None)
+    np.testing.assert_array_equal(_match_histogram(image, reference_cdf), expected)
+
+
+@pytest.mark.parametrize("spec", SPECS.values(), ids=SPECS.keys())
+def test_pil_matches_reference_on_8bit_sources(spec, sources):
+    paths = [p for p in sources(spec) if not p.endswith('gray16.png')]
+    transform = PreprocessTransform(spec)
+    expected = transform(paths, backend=reference_backend())
+    assert _max_diff(transform(paths, backend='pil'), expected) <= EQUIVALENCE_ATOL
+
+
+@pytest.mark.filterwarnings("ignore:Preprocessing backend")
+@pytest.mark.parametrize("backend", CANDIDATES)
+@pytest.mark.parametrize("spec", SPECS.values(), ids=SPECS.keys())
+def test_selected_backend_matches_reference(spec, backend, sources, monkeypatch):
+    # Whatever select_backend() picked, a transform falls back to the
+    # reference for specs the choice is not equivalent on (e.g. PIL with
+    # 16-bit sources), so its output always matches
+    monkeypatch.setattr(ImagePreprocessing, '_active_backend', backend)
+    paths = sources(spec)
+    transform = PreprocessTransform(spec)
+    out = transform(paths)
+    expected = transform(paths, backend=reference_backend())
+    assert _max_diff(out, expected) <= EQUIVALENCE_ATOL
+    assert transform.backend() in (backend, reference_backend())